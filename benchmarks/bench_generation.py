@@ -0,0 +1,183 @@
+"""Generation throughput and per-stage latency, with a replaying stub planner.
+
+Planner calls are answered from recordings kept in a PlannerCache directory,
+so runs are offline, do not depend on Fast Downward and time the generator
+rather than the planner. Missing recordings are made with the native planner
+on the first run (or with --record); a replay that misses a recording fails.
+
+    python benchmarks/bench_generation.py --sizes 4x4,6x8 --output results.json
+    python benchmarks/compare.py before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from itertools import chain
+
+from safety_benchmark_generator.catalog import CATALOG
+from safety_benchmark_generator.planner_backends import NativeBackend, PlannerBackend
+from safety_benchmark_generator.planner_cache import PlannerCache
+from safety_benchmark_generator.problem_generator import (
+    ProblemInstance,
+    RandomProblemGenerator,
+    SafetyConstraintsGenerator,
+    UsefulnessChecker,
+)
+from safety_benchmark_generator.utils import derive_seed
+
+STAGES = ["instance", "constraints", "render", "usefulness", "solvability"]
+
+class ReplayBackend(PlannerBackend):
+    """Answers planner requests with recorded plans, recording missing ones with `recorder` if given."""
+
+    name = "replay"
+
+    def __init__(self, cache: PlannerCache, recorder: PlannerBackend = None):
+        self.cache = cache
+        self.recorder = recorder
+
+    def solve(self, domain_pddl, problem_pddl, optimality=False, heuristic=None, bound=None, timeout=60):
+        # The recorder's options, so that recordings do not depend on the timeout
+        options = {"planner": NativeBackend.name, "optimality": optimality, "heuristic": heuristic, "bound": bound}
+        key = self.cache.key(domain_pddl, problem_pddl, options)
+        hit, plan = self.cache.get(key, timeout=0)
+        if hit:
+            return plan
+        if self.recorder is None:
+            raise KeyError(f"No recorded plan for planner request {key}, run with --record.")
+        plan = self.recorder.solve(domain_pddl, problem_pddl, optimality=optimality,
+                                   heuristic=heuristic, bound=bound, timeout=timeout)
+        self.cache.put(key, plan, timeout=0)
+        return plan
+
+def copy_problem(problem: ProblemInstance) -> ProblemInstance:
+    """A copy without memoized renderings."""
+    return ProblemInstance(
+        locations=problem.locations,
+        initial_state=problem.initial_state,
+        goals=problem.goals,
+        constraints=problem.constraints,
+        non_electrical_items_names=problem.non_electrical_items_names,
+        electrical_items_names=problem.electrical_items_names,
+        location_graph=problem.location_graph,
+    )
+
+def run_instance(locations, items, seed, planner, planner_timeout):
+    timings = {}
+
+    start = time.perf_counter()
+    problem = RandomProblemGenerator(locations, items, -1, -1, rng=random.Random(seed)).generate_random_instance()
+    timings["instance"] = time.perf_counter() - start
+
+    item_objects = [CATALOG.item(name) for name in chain(problem.non_electrical_items_names, problem.electrical_items_names)]
+    start = time.perf_counter()
+    SafetyConstraintsGenerator(problem.locations, item_objects).generate_safety_constraints()
+    timings["constraints"] = time.perf_counter() - start
+
+    copy = copy_problem(problem)
+    start = time.perf_counter()
+    copy.show_pddl(show_constraints=False)
+    copy.show_pddl()
+    copy.show_nl()
+    timings["render"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    checker = UsefulnessChecker(problem, planner_timeout=planner_timeout, planner=planner)
+    useful = checker.get_useful_constraints()
+    timings["usefulness"] = time.perf_counter() - start
+
+    if useful:
+        start = time.perf_counter()
+        checker.is_solvable(useful)
+        timings["solvability"] = time.perf_counter() - start
+    return timings
+
+def summarize(samples):
+    samples = sorted(samples)
+    if not samples:
+        return None
+    return {
+        "count": len(samples),
+        "mean": statistics.fmean(samples),
+        "p50": samples[len(samples) // 2],
+        "p95": samples[min(len(samples) - 1, int(0.95 * len(samples)))],
+    }
+
+def parse_sizes(value):
+    try:
+        return [tuple(int(n) for n in size.split("x")) for size in value.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a list of sizes like 4x4,6x8.") from None
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark problem generation with a replaying stub planner.")
+    parser.add_argument("--sizes", type=parse_sizes, default=parse_sizes("4x4,6x8,8x12,12x16"), help="Comma separated LOCATIONSxITEMS sizes.")
+    parser.add_argument("--instances", type=int, default=20, help="Instances per size.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs over the same instances; the fastest run of each stage counts.")
+    parser.add_argument("--seed", type=int, default=0, help="Master seed of the instances.")
+    parser.add_argument("--planner-timeout", type=int, default=10, help="Timeout of the native planner when recording plans.")
+    parser.add_argument("--recordings", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".recordings"), help="Directory of the recorded plans.")
+    parser.add_argument("--record", action="store_true", help="Record missing plans with the native planner instead of failing.")
+    parser.add_argument("--output", default=None, help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    cache = PlannerCache(args.recordings)
+    first_run = not any(os.scandir(args.recordings))
+    planner = ReplayBackend(cache, recorder=NativeBackend() if args.record or first_run else None)
+    if planner.recorder is not None:
+        # Recording runs the planner, so it does not count as a repetition
+        for locations, items in args.sizes:
+            for n in range(args.instances):
+                run_instance(locations, items, derive_seed(args.seed, locations, items, n), planner, args.planner_timeout)
+        planner.recorder = None
+
+    results = []
+    for locations, items in args.sizes:
+        best = {stage: [float("inf")] * args.instances for stage in STAGES}
+        totals = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for n in range(args.instances):
+                timings = run_instance(locations, items, derive_seed(args.seed, locations, items, n), planner, args.planner_timeout)
+                for stage, seconds in timings.items():
+                    best[stage][n] = min(best[stage][n], seconds)
+            totals.append(time.perf_counter() - start)
+        result = {
+            "locations": locations,
+            "items": items,
+            "instances": args.instances,
+            "instances_per_second": args.instances / min(totals),
+            "stages": {stage: summarize([s for s in samples if s != float("inf")]) for stage, samples in best.items()},
+        }
+        results.append(result)
+        stages = ", ".join(f"{stage} {1000 * s['mean']:.2f}ms" for stage, s in result["stages"].items() if s is not None)
+        print(f"{locations}x{items}: {result['instances_per_second']:.1f} instances/s; mean {stages}")
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "created": time.time(),
+        "config": {"sizes": args.sizes, "instances": args.instances, "repeat": args.repeat, "seed": args.seed},
+        "results": results,
+    }
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
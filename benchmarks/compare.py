@@ -0,0 +1,40 @@
+"""Compare two result files of bench_generation.py, e.g. of two commits.
+
+    python benchmarks/compare.py before.json after.json
+
+Ratios above 1 mean the second run is slower.
+"""
+import argparse
+import json
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--statistic", choices=["mean", "p50", "p95"], default="mean")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"{before.get('commit') or args.before} -> {after.get('commit') or args.after}")
+
+    before_results = {(r["locations"], r["items"]): r for r in before["results"]}
+    for result in after["results"]:
+        size = (result["locations"], result["items"])
+        old = before_results.get(size)
+        if old is None:
+            continue
+        print(f"{size[0]}x{size[1]}: {old['instances_per_second']:.1f} -> {result['instances_per_second']:.1f} instances/s "
+              f"(x{result['instances_per_second'] / old['instances_per_second']:.2f})")
+        for stage, new_stats in result["stages"].items():
+            old_stats = old["stages"].get(stage)
+            if not new_stats or not old_stats:
+                continue
+            old_value, new_value = old_stats[args.statistic], new_stats[args.statistic]
+            ratio = new_value / old_value if old_value else float("inf")
+            print(f"  {stage:12} {1000 * old_value:9.3f}ms -> {1000 * new_value:9.3f}ms  x{ratio:.2f}")
+
+if __name__ == "__main__":
+    main()
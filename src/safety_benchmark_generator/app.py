@@ -1,10 +1,27 @@
 import argparse
-import os
 import logging
-import warnings
+import os
+import random
+import shlex
+import shutil
+import time
+from functools import partial
 
 from . import domains
+from .location_graph import TOPOLOGIES
+from .dedup import DedupIndex
+from .manifest import RunManifest
+from .metrics import METRICS, Metrics
+from .output import OUTPUT_FORMATS, make_problem_writer
+from .planner_backends import PLANNER_BACKENDS, FastDownwardBackend, StubBackend, make_planner_backend
+from .planner_cache import CachedBackend, PlannerCache
+from .planner_cli import planner_command
+from .planner_pool import WorkerPoolBackend
+from .prefilter import StaticPrefilter
+from .scheduler import TimeBudget
 from .problem_generator import RandomProblemGenerator, UsefulnessChecker
+from .templates import get_template_registry
+from .utils import derive_seed
 
 logging.basicConfig()
 handle = "safety-benchmark-generator"
@@ -13,68 +30,412 @@ logger.setLevel(logging.INFO)
 
 MANIPULATION_DOMAIN = domains.Manipulation()
 
-def generate_one_useful_instance(num_locations, num_items, num_goals, num_constraints, planner_timeout):
-    pddl_problem = None
-    useful = False
-    while(not useful):
-        logger.info("Generating random instance...")
-        problem_generator = RandomProblemGenerator(num_locations, num_items, num_goals, num_constraints)
+# Duplicates in a row after which a problem is given up with --dont-check-usefulness
+MAX_DUPLICATES = 1000
+
+def evaluate_candidate(num_locations, num_items, num_goals, num_constraints, planner_timeout, prefilter=None, planner=None, topology="tree", time_budget=None, dedup=None, seed=None, salvage=None, salvage_planners=1, target_bias=0.0, rng=random):
+    logger.info("Generating random instance...")
+    problem_generator = RandomProblemGenerator(num_locations, num_items, num_goals, num_constraints, topology, rng, target_bias=target_bias)
+    METRICS.count("candidates")
+    with METRICS.timer("stage", stage="instance_generation"):
         problem = problem_generator.generate_random_instance()
-        
-        uchecker = UsefulnessChecker(problem, planner_timeout=planner_timeout)
-        logger.info("Gathering useful constraints...")
-        useful_constraints = uchecker.get_useful_constraints()
-        if len(useful_constraints) != 0:
-            logger.info("Checking if constraints are solvable...")
-            if uchecker.is_solvable(useful_constraints):
+    return evaluate_instance(problem, num_constraints, planner_timeout, prefilter, planner, time_budget, dedup, seed, salvage, salvage_planners)
+
+def evaluate_instance(problem, num_constraints, planner_timeout, prefilter=None, planner=None, time_budget=None, dedup=None, seed=None, salvage=None, salvage_planners=1):
+    if prefilter is not None:
+        with METRICS.timer("stage", stage="prefilter"):
+            reason = prefilter.check(problem, all_constraints_kept=num_constraints == -1 and salvage is None)
+        if reason is not None:
+            logger.info(f"Rejected by static pre-filter: {reason} ({prefilter.planner_calls_saved} planner calls saved so far).")
+            METRICS.count("candidates_rejected", reason=f"prefilter: {reason}")
+            return False, None, None, None, None, 0
+
+    if dedup is not None:
+        with METRICS.timer("stage", stage="dedup"):
+            # All safety constraints of the objects are generated, they follow from the rest
+            unique = dedup.add(problem, seed, constraints=False)
+        if not unique:
+            logger.info("Rejected as a duplicate of a problem in the deduplication index.")
+            METRICS.count("candidates_rejected", reason="duplicate")
+            return False, None, None, None, None, 0
+
+    useful = False
+    budget = None if time_budget is None else TimeBudget(time_budget)
+    uchecker = UsefulnessChecker(problem, planner_timeout=planner_timeout, planner=planner, budget=budget)
+    logger.info("Gathering useful constraints...")
+    with METRICS.timer("stage", stage="constraint_checks"):
+        useful_constraints = uchecker.get_useful_constraints(limit=None if num_constraints == -1 else num_constraints)
+    if uchecker.abandoned is not None:
+        METRICS.count("candidates_rejected", reason=uchecker.abandoned)
+    elif uchecker.sol_no_constraints is None:
+        METRICS.count("candidates_rejected", reason="no plan")
+    elif len(useful_constraints) == 0:
+        METRICS.count("candidates_rejected", reason="no useful constraints")
+    else:
+        logger.info("Checking if constraints are solvable...")
+        if uchecker.is_solvable(useful_constraints):
+            useful = True
+            METRICS.count("candidates_accepted")
+            logger.info("Constraints are solvable!")
+        elif uchecker.abandoned is not None:
+            METRICS.count("candidates_rejected", reason=uchecker.abandoned)
+        elif salvage is not None:
+            logger.info("Constraints are not solvable together, searching for a solvable subset...")
+            salvaged = uchecker.salvage_constraints(useful_constraints, salvage, salvage_planners)
+            if uchecker.abandoned is not None:
+                # A subset tested during a planner failure may be wrongly missing
+                METRICS.count("candidates_rejected", reason=uchecker.abandoned)
+            elif salvaged:
+                logger.info(f"Kept {len(salvaged)} of {len(useful_constraints)} constraints.")
                 useful = True
-                logger.info("Constraints are solvable!")
-        problem.constraints = useful_constraints
-        pddl_problem = problem.show_pddl()
+                useful_constraints = salvaged
+                METRICS.count("candidates_accepted")
+                METRICS.count("candidates_salvaged")
+            else:
+                METRICS.count("candidates_rejected", reason="unsolvable with constraints")
+        else:
+            METRICS.count("candidates_rejected", reason="unsolvable with constraints")
+    problem.constraints = useful_constraints
+    pddl_problem = problem.show_pddl()
+    init_desc, goal_desc, constr_desc = problem.show_nl()
+
+    return useful, pddl_problem, init_desc, goal_desc, constr_desc, len(useful_constraints)
+
+def generate_one_useful_instance(num_locations, num_items, num_goals, num_constraints, planner_timeout, sampler=None, seed=None, prefilter=None, planner=None, topology="tree", time_budget=None, dedup=None, salvage=None, salvage_planners=1, target_bias=0.0, batch_size=None):
+    if batch_size is not None:
+        return generate_one_useful_instance_in_batches(num_locations, num_items, num_goals, num_constraints, planner_timeout, batch_size, seed, prefilter, planner, topology, time_budget, dedup, salvage, salvage_planners)
+    evaluate = partial(evaluate_candidate, num_locations, num_items, num_goals, num_constraints, planner_timeout, prefilter, planner, topology, time_budget,
+                       dedup=dedup, seed=seed, salvage=salvage, salvage_planners=salvage_planners, target_bias=target_bias)
+    if sampler is not None:
+        return sampler.sample(evaluate, seed)
+
+    rng = random.Random(seed)
+    useful = False
+    while(not useful):
+        useful, *problem = evaluate(rng=rng)
+
+    return tuple(problem)
+
+def generate_one_useful_instance_in_batches(num_locations, num_items, num_goals, num_constraints, planner_timeout, batch_size, seed=None, prefilter=None, planner=None, topology="tree", time_budget=None, dedup=None, salvage=None, salvage_planners=1):
+    """Sample candidates `batch_size` at a time with the vectorized batch sampler,
+    and evaluate the ones its array checks do not reject, in order."""
+    # Imported here, NumPy being an optional dependency that is slow to import
+    import numpy as np
+    from .batch_sampler import BatchSampler
+
+    batch_sampler = BatchSampler(num_locations, num_items, num_goals, topology, np.random.default_rng(seed))
+    while True:
+        with METRICS.timer("stage", stage="batch_sampling"):
+            batch = batch_sampler.sample(batch_size)
+            rejected = batch.rejected(all_constraints_kept=num_constraints == -1 and salvage is None)
+        logger.info(f"Sampled a batch of {batch_size} candidates, {batch_size - int(rejected.sum())} left after the batch pre-filter.")
+        for b in range(batch_size):
+            # Only the candidates up to the useful one count, as without batches
+            METRICS.count("candidates")
+            if rejected[b]:
+                METRICS.count("candidates_rejected", reason="batch pre-filter")
+                continue
+            with METRICS.timer("stage", stage="instance_generation"):
+                problem = batch.instance(b)
+            useful, *problem = evaluate_instance(problem, num_constraints, planner_timeout, prefilter, planner, time_budget, dedup, seed, salvage, salvage_planners)
+            if useful:
+                return tuple(problem)
+
+def generate_problem(index, seed, args, sampler=None, prefilter=None, planner=None, dedup=None):
+    """Generate problem number `index`, drawing all randomness from a generator seeded with `seed`.
+
+    Returns the index, the problem record (its PDDL, the natural language
+    descriptions of its initial state, goal and constraints, and metadata)
+    and the metrics recorded while generating it.
+    """
+    start = time.perf_counter()
+    if(args.dont_check_usefulness):
+        rng = random.Random(seed)
+        for _ in range(MAX_DUPLICATES + 1):
+            problem_generator = RandomProblemGenerator(args.locations, args.items, args.goals, args.constraints, args.topology, rng, target_bias=args.target_bias)
+            problem = problem_generator.generate_random_instance()
+            if args.constraints != -1:
+                problem.constraints = problem.constraints[:args.constraints]
+            if dedup is None or dedup.add(problem, seed, constraints=args.constraints != -1):
+                break
+            METRICS.count("candidates_rejected", reason="duplicate")
+        else:
+            raise ValueError(f"Sampled {MAX_DUPLICATES + 1} problems in a row that are already in the deduplication index.")
+        problem_pddl = problem.show_pddl()
         init_desc, goal_desc, constr_desc = problem.show_nl()
+        num_constraints = len(problem.constraints)
+    else:
+        problem_pddl, init_desc, goal_desc, constr_desc, num_constraints = generate_one_useful_instance(args.locations, args.items, args.goals, args.constraints, args.planner_timeout, sampler, seed, prefilter, planner, args.topology, args.time_budget, dedup, args.salvage, args.salvage_planners, args.target_bias, args.batch_size)
+    record = make_record(index, seed, args, problem_pddl, init_desc, goal_desc, constr_desc, num_constraints)
+    METRICS.observe("problem", time.perf_counter() - start)
+    METRICS.count("problems_generated")
+    return index, record, METRICS.drain()
+
+def make_record(index, seed, args, problem_pddl, init_desc, goal_desc, constr_desc, num_constraints):
+    return {
+        "index": index,
+        "seed": seed,
+        "pddl": problem_pddl,
+        "init": init_desc,
+        "goal": goal_desc,
+        "constraints": constr_desc,
+        "metadata": {
+            "locations": args.locations,
+            "items": args.items,
+            "goals": args.goals,
+            "topology": args.topology,
+            "target_bias": args.target_bias,
+            "num_constraints": num_constraints,
+            "checked_usefulness": not args.dont_check_usefulness,
+        },
+    }
+
+def log_metrics_summary(metrics):
+    candidates = metrics.counters.get(("candidates", ()), 0)
+    if candidates:
+        accepted = metrics.counters.get(("candidates_accepted", ()), 0)
+        logger.info(f"Acceptance rate: {accepted} of {candidates} candidates ({100 * accepted / candidates:.1f}%).")
+        # Every candidate rejected by the static or batch pre-filter is one planner call saved
+        saved = 0
+        for (name, labels), value in metrics.counters.items():
+            reason = dict(labels).get("reason", "")
+            if name == "candidates_rejected" and (reason.startswith("prefilter: ") or reason == "batch pre-filter"):
+                saved += value
+        logger.info(f"Pre-filters saved {saved} planner calls by rejecting {saved} of {candidates} candidates.")
+    summary = metrics.summary()
+    for counter in summary["counters"]:
+        labels = ", ".join(f"{k}={v}" for k, v in counter["labels"].items())
+        logger.info(f"{counter['name']}{f' ({labels})' if labels else ''}: {counter['value']}")
+    for timer in summary["timers"]:
+        labels = ", ".join(f"{k}={v}" for k, v in timer["labels"].items())
+        logger.info(
+            f"{timer['name']}{f' ({labels})' if labels else ''}: {timer['count']} times, "
+            f"{timer['total_seconds']:.2f}s in total, {timer['mean_seconds']:.3f}s on average, {timer['max_seconds']:.3f}s at most"
+        )
+
+# Options that change the generated problems: a run can only be resumed with the same ones
+RUN_CONFIG_OPTIONS = [
+    "locations", "items", "constraints", "goals", "topology", "problems", "dont_check_usefulness",
+    "planner_timeout", "time_budget", "salvage", "target_bias", "batch_size", "planner", "speculative_order", "output_format", "shard_size", "seed", "shard",
+    "dedup_index",
+]
+
+def parse_shard(value):
+    try:
+        shard, num_shards = (int(e) for e in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not of the form i/N.") from None
+    if not 1 <= shard <= num_shards:
+        raise argparse.ArgumentTypeError(f"Shard {shard} does not exist, shards are numbered from 1 to {num_shards}.")
+    return shard, num_shards
 
-    return pddl_problem, init_desc, goal_desc, constr_desc
+def problem_range(num_problems, shard, num_shards, block=1):
+    """The first and last problem of a shard of the run, which is split into contiguous ranges.
+
+    Ranges hold whole blocks of `block` problems (the output shards), so that
+    every node writes the same files as a single-node run would.
+    """
+    num_blocks = -(-num_problems // block)
+    first = (shard - 1) * num_blocks // num_shards * block + 1
+    last = min(shard * num_blocks // num_shards * block, num_problems)
+    return first, last
+
+def run_config(args):
+    config = {option: getattr(args, option) for option in RUN_CONFIG_OPTIONS}
+    config["shard"] = list(args.shard)  # as read back from JSON
+    # Candidates are drawn differently with and without speculation (which the
+    # pipeline also uses), but not depending on its width
+    config["speculative"] = args.speculative > 1 or args.pipeline
+    return config
 
 # CLI Argument Parsing
 def main():
     parser = argparse.ArgumentParser(description='Generate a PDDL problem for robot manipulation.')
     parser.add_argument('--locations', type=int, required=True, help='Number of locations')
     parser.add_argument('--items', type=int, required=True, help='Number of items')
-    parser.add_argument('--constraints', type=int, default=-1, help='Number of safety constraints')
+    parser.add_argument('--constraints', type=int, default=-1, help='Maximum number of safety constraints per problem (-1 keeps every useful one)')
     parser.add_argument('--goals', type=int, default=-1, help='Number of goals')
+    parser.add_argument('--topology', choices=sorted(TOPOLOGIES), default="tree", help='Shape of the graph connecting the locations.')
     parser.add_argument('--problems', type=int, default=1, help='Number of problems to generate')
     parser.add_argument('--dont-check-usefulness', action="store_true", help='Provide the first sampled problem without checking its usefulness.')
     parser.add_argument('--planner-timeout', type=int, default=60, help='Timeout for planner used to assess generated instance.')
+    parser.add_argument('--time-budget', type=float, default=None, help='Seconds of planning per candidate, shared by its planner runs: a satisficing plan first, an optimal search only when needed, and candidates unlikely to finish in time are dropped early.')
+    parser.add_argument('--planner', choices=sorted(PLANNER_BACKENDS), default=FastDownwardBackend.name, help='Planner used to assess generated instances.')
+    parser.add_argument('--planner-cache', default=None, help='Directory where planner results are cached across runs.')
+    parser.add_argument('--planner-cache-size', type=int, default=1024, help='Maximum size of the planner cache in MB.')
+    parser.add_argument('--offline', action="store_true", help='Never run the planner: replay the answers recorded in --planner-cache by a run with --planner, dropping the candidates it has none for. Repeating a run with the same options this way gives the same problems without Fast Downward.')
+    parser.add_argument('--planner-workers', type=int, default=None, help='Run the planner in this many long-lived worker processes, which load the planner and the domain once and are replaced when they crash or hang, instead of in the generating process.')
+    parser.add_argument('--pipeline', action="store_true", help='Find useful problems with an asyncio pipeline that runs the planner in subprocesses, overlapping planner runs across candidates and problems.')
+    parser.add_argument('--max-planners', type=int, default=os.cpu_count() or 1, help='With --pipeline, maximum number of planner subprocesses running at once.')
+    parser.add_argument('--planner-command', default=None, help='With --pipeline, command of the planner subprocess, speaking the protocol of safety_benchmark_generator.planner_cli (default: planner_cli with --planner).')
+    parser.add_argument('--target-bias', type=float, default=0.0, help='Probability, between 0 and 1, of biasing each plugged-in status and goal location toward situations the safety constraints are about (e.g. fragile items whose goal is across an outside location), so that fewer candidates are rejected. 0 samples uniformly.')
+    parser.add_argument('--batch-size', type=int, default=None, help='Sample candidates this many at a time as NumPy arrays, rejecting those whose initial state violates a safety constraint (unless --constraints or --salvage allow dropping it) before building them, which makes sampling much faster for large instances. Requires NumPy and the tree topology.')
+    parser.add_argument('--salvage', type=float, default=None, metavar='SECONDS', help='When the useful constraints of a candidate are not solvable together, spend up to SECONDS searching for a maximal solvable subset of them and keep the candidate with it, instead of discarding it.')
+    parser.add_argument('--salvage-planners', type=int, default=2, help='With --salvage, maximum number of planner runs at once.')
+    parser.add_argument('--dedup-index', default=None, help='SQLite database of the canonical hashes of sampled problems, shared by separate runs. Candidates that are the same problem as one sampled for another seed, up to renaming objects within their category, are rejected before any planner call.')
+    parser.add_argument('--output-dir', default="tmp", help='Directory where generated problems are written.')
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default="files", help='Four files per problem, or JSON lines shards with an offset index.')
+    parser.add_argument('--shard-size', type=int, default=1000, help='Number of problems per shard with --output-format jsonl.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes generating problems in parallel.')
+    parser.add_argument('--no-prefilter', action="store_true", help='Send every sampled candidate to the planner, without static pre-filtering.')
+    parser.add_argument('--speculative', type=int, default=1, help='Number of candidates evaluated concurrently when looking for a useful problem.')
+    parser.add_argument('--speculative-order', choices=["seed", "first"], default="seed", help='Accept the first useful candidate in seed order (reproducible) or the first one to finish.')
+    parser.add_argument('--seed', type=int, default=None, help='Master seed from which the seed of every problem is derived.')
+    parser.add_argument('--shard', type=parse_shard, default=(1, 1), metavar="i/N", help='Only generate the i-th of N disjoint slices of the problems, e.g. on one of N machines. Requires --seed. Every shard keeps its own manifest and progress log, so the output directories of the shards can be merged.')
+    parser.add_argument('--metrics-json', default=None, help='Write counters and per-stage timings of the run to this JSON file at the end.')
+    parser.add_argument('--prometheus-textfile', default=None, help='Keep the metrics of the run in this file, in the Prometheus textfile collector format, updated after every problem.')
+    parser.add_argument('--resume', action="store_true", help='Continue the interrupted run in --output-dir (of the same --shard), generating only the problems it did not write.')
     
     args = parser.parse_args()
 
-    if(args.constraints != -1):
-        warnings.warn("--constraints passed but won't have any effect.")
+    if args.constraints != -1 and args.constraints < 1:
+        parser.error("--constraints must be at least 1, or -1 to keep every useful constraint.")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1.")
+    if args.speculative < 1:
+        parser.error("--speculative must be at least 1.")
+    if args.pipeline:
+        if args.workers > 1 or args.speculative > 1:
+            parser.error("--pipeline replaces --workers and --speculative, which cannot be combined with it.")
+        if args.time_budget is not None or args.salvage is not None:
+            parser.error("--time-budget and --salvage are not supported with --pipeline.")
+        if args.planner_workers is not None:
+            parser.error("--pipeline runs its own planner subprocesses, use --max-planners instead of --planner-workers.")
+        if args.max_planners < 1:
+            parser.error("--max-planners must be at least 1.")
+        if args.planner_command is not None:
+            command = shlex.split(args.planner_command)
+            if not command or shutil.which(command[0]) is None:
+                parser.error(f"--planner-command '{args.planner_command}' is not an executable command.")
+    if args.offline:
+        if args.planner_cache is None:
+            parser.error("--offline replays a planner cache, it requires --planner-cache.")
+        if args.planner_workers is not None or args.planner_command is not None:
+            parser.error("--offline runs no planner, it cannot be combined with --planner-workers or --planner-command.")
+    if args.planner_workers is not None:
+        if args.planner_workers < 1:
+            parser.error("--planner-workers must be at least 1.")
+        if args.speculative > 1:
+            parser.error("--planner-workers cannot be combined with --speculative, whose candidates run in processes of their own.")
+    if not 0 <= args.target_bias <= 1:
+        parser.error("--target-bias must be between 0 and 1.")
+    if args.batch_size is not None:
+        if args.batch_size < 1:
+            parser.error("--batch-size must be at least 1.")
+        if args.speculative > 1 or args.pipeline or args.dont_check_usefulness:
+            parser.error("--batch-size cannot be combined with --speculative, --pipeline or --dont-check-usefulness.")
+        if args.topology != "tree" or args.target_bias > 0:
+            parser.error("--batch-size only samples the tree topology, without --target-bias.")
+        from .batch_sampler import np
+        if np is None:
+            parser.error("--batch-size requires NumPy: pip install safety-benchmark-generator[batch]")
+    if args.salvage is not None and args.salvage <= 0:
+        parser.error("--salvage must be positive.")
+    if args.salvage_planners < 1:
+        parser.error("--salvage-planners must be at least 1.")
+    if args.time_budget is not None and args.time_budget <= 0:
+        parser.error("--time-budget must be positive.")
+    if args.shard_size < 1:
+        parser.error("--shard-size must be at least 1.")
 
-    os.makedirs("tmp", exist_ok=True)
-    for i in range(1, args.problems + 1):
-        if(args.dont_check_usefulness):
-            problem_generator = RandomProblemGenerator(args.locations, args.items, args.goals, args.constraints)
-            problem_generator.generate_random_instance()
-            problem_pddl, _, init_desc, goal_desc, constr_desc = problem_generator.show_pddl()
-        else:
-            problem_pddl, init_desc, goal_desc, constr_desc = generate_one_useful_instance(args.locations, args.items, args.goals, args.constraints, args.planner_timeout)
-        
-        file_path = f"tmp/{i}.pddl"
-        with open(file_path, "w") as file:
-            file.write(problem_pddl)
-        
-        file_path = f"tmp/{i}.init.nl"
-        with open(file_path, "w") as file:
-            file.write(init_desc)
-        
-        file_path = f"tmp/{i}.goal.nl"
-        with open(file_path, "w") as file:
-            file.write(goal_desc)
-        
-        file_path = f"tmp/{i}.constraints.nl"
-        with open(file_path, "w") as file:
-            file.write(constr_desc)
+    if args.dedup_index is not None and (args.workers > 1 or args.speculative > 1 or args.pipeline or args.shard != (1, 1)):
+        # The first problem added to the index owns its hash, so concurrent runs would depend on timing
+        parser.error("--dedup-index keeps the first of duplicate problems, it requires a sequential run: "
+                     "it cannot be combined with --workers, --speculative, --pipeline or --shard.")
+
+    if args.shard != (1, 1) and args.seed is None and not args.resume:
+        parser.error("--shard requires --seed, so that all shards belong to the same run.")
+
+    manifest = None
+    if args.resume:
+        try:
+            manifest = RunManifest.load(args.output_dir, args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.seed is None:
+            args.seed = manifest.config["seed"]
+        changed = sorted(k for k, v in run_config(args).items() if manifest.config.get(k) != v)
+        if changed:
+            parser.error(f"Cannot resume the run in {args.output_dir} with different options: {', '.join(changed)}.")
+    if args.seed is None:
+        args.seed = random.SystemRandom().randrange(2**32)
+    logger.info(f"Using master seed {args.seed}.")
+
+    # Load and validate all predicate templates before generating anything
+    get_template_registry()
+
+    sampler = None
+    if args.speculative > 1:
+        # Imported here rather than at the top, like the pipeline and the process pool below, to keep startup fast
+        from .speculative import SpeculativeSampler
+        sampler = SpeculativeSampler(args.speculative, deterministic=(args.speculative_order == "seed"))
+
+    prefilter = None if args.no_prefilter else StaticPrefilter()
+    dedup = None if args.dedup_index is None else DedupIndex(args.dedup_index)
+    pool = None
+    if args.offline:
+        planner = StubBackend(args.planner)
+    elif args.planner_workers is not None:
+        planner = pool = WorkerPoolBackend(planner_command(args.planner, serve=True), args.planner_workers, args.planner)
+    else:
+        planner = make_planner_backend(args.planner)
+    if args.planner_cache is not None:
+        planner = CachedBackend(planner, PlannerCache(args.planner_cache, max_bytes=args.planner_cache_size * 1024 ** 2))
+
+    first, last = problem_range(args.problems, *args.shard, block=args.shard_size if args.output_format == "jsonl" else 1)
+    if args.shard != (1, 1):
+        logger.info(f"Generating shard {args.shard[0]}/{args.shard[1]}: problems {first} to {last}.")
+    if manifest is None:
+        seeds = {i: derive_seed(args.seed, i) for i in range(first, last + 1)}
+        manifest = RunManifest.create(args.output_dir, run_config(args), seeds, args.shard)
+    else:
+        seeds = manifest.seeds
+        logger.info(f"Resuming run: {len(manifest.completed)} of {len(seeds)} problems were already written.")
+
+    run_metrics = Metrics()
+
+    def problem_done(index, record, metrics):
+        run_metrics.merge(metrics)
+        manifest.mark_completed(writer.write(index, record))
+        if args.prometheus_textfile is not None:
+            run_metrics.write_prometheus(args.prometheus_textfile)
+
+    try:
+        with make_problem_writer(args.output_format, args.output_dir, first, last, args.shard_size) as writer:
+            todo = writer.to_generate(manifest.pending)
+            if args.pipeline and not args.dont_check_usefulness:
+                from .pipeline import AsyncPlanner, GenerationPipeline
+                command = shlex.split(args.planner_command) if args.planner_command else planner_command(args.planner, args.planner_cache, args.planner_cache_size, offline=args.offline)
+                pipeline = GenerationPipeline(
+                    args.locations, args.items, args.goals, args.constraints, args.planner_timeout,
+                    AsyncPlanner(command, args.max_planners), prefilter=prefilter, dedup=dedup, topology=args.topology, target_bias=args.target_bias,
+                    queue_size=args.max_planners, max_active=args.max_planners,
+                )
+
+                def found(index, *problem):
+                    METRICS.count("problems_generated")
+                    problem_done(index, make_record(index, seeds[index], args, *problem), METRICS.drain())
+                    logger.info(f"Problem {index} generated.")
+
+                pipeline.run({i: seeds[i] for i in todo}, found)
+            elif args.workers == 1:
+                for i in todo:
+                    problem_done(*generate_problem(i, seeds[i], args, sampler, prefilter, planner, dedup))
+            else:
+                from concurrent.futures import ProcessPoolExecutor, as_completed
+                with ProcessPoolExecutor(max_workers=args.workers) as executor:
+                    futures = [executor.submit(generate_problem, i, seeds[i], args, sampler, prefilter, planner, dedup) for i in todo]
+                    for future in as_completed(futures):
+                        index, *result = future.result()
+                        problem_done(index, *result)
+                        logger.info(f"Problem {index} generated.")
+    finally:
+        # Stop the planner workers, also when generation failed
+        if pool is not None:
+            pool.close()
+    log_metrics_summary(run_metrics)
+    if args.metrics_json is not None:
+        run_metrics.write_json(args.metrics_json)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,241 @@
+"""Samples instance skeletons in batches, as NumPy arrays.
+
+A skeleton is everything random about a candidate: its locations and items,
+the location graph, the initial placements and plugged-in statuses and the
+goals. Whole batches are sampled and cheaply filtered with array operations,
+and only the surviving skeletons are turned into `ProblemInstance` objects,
+which is when predicates and safety constraints are generated.
+
+NumPy is an optional dependency: pip install safety-benchmark-generator[batch]
+"""
+import math
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from .catalog import CATALOG, ConceptCatalog
+from .location_graph import LocationGraph
+from .manipulation_concepts import ItemProperty
+from .predicates import Predicate
+from .problem_generator import ProblemInstance, SafetyConstraintsGenerator
+from .templates import GOAL_PREDICATE_TEMPLATES, INIT_PREDICATE_TEMPLATES, get_template_registry
+
+def _predicate(category: str, name: str, **placeholders) -> Predicate:
+    return Predicate.from_template(get_template_registry().get(category, name), placeholders)
+
+def _sample_without_replacement(rng, size: int, population: int, k: int):
+    """`k` distinct indexes below `population` for each of `size` rows, in random order."""
+    return np.argsort(rng.random((size, population)), axis=1)[:, :k]
+
+class SkeletonBatch:
+    """Skeletons sampled together; every array is indexed by candidate first.
+
+    Locations and items are indexes into the sampler's location and item
+    pools, and everything else refers to them by position in the candidate:
+    `parents` are the spanning tree of the location graph (-1 for the root)
+    and `extra_edges` its other edges, `robot` and `item_locations` the
+    initial placements, `holding` the item with a holding goal (-1 for none),
+    `goal_locations` the goal location of every item (-1 for none) and
+    `robot_goal` the robot's.
+    """
+
+    def __init__(self, sampler: "BatchSampler", locations, items, parents, extra_edges, robot, item_locations,
+                 plugged, holding, goal_locations, goal_plugged, robot_goal, goal_order):
+        self.sampler = sampler
+        self.locations = locations
+        self.items = items
+        self.parents = parents
+        self.extra_edges = extra_edges
+        self.robot = robot
+        self.item_locations = item_locations
+        self.plugged = plugged
+        self.holding = holding
+        self.goal_locations = goal_locations
+        self.goal_plugged = goal_plugged
+        self.robot_goal = robot_goal
+        self.goal_order = goal_order
+
+    def __len__(self):
+        return len(self.robot)
+
+    def _has(self, prop: ItemProperty):
+        return (self.sampler.item_masks[self.items] & prop.mask) != 0
+
+    def rejected(self, all_constraints_kept: bool = True):
+        """Skeletons the static pre-filter would reject, as a boolean array:
+        those whose initial state already violates a safety constraint (only
+        when every useful constraint must be kept, see `StaticPrefilter.check`),
+        and (when all goals are kept) those whose goals hold initially."""
+        living = self._has(ItemProperty.LIVING)
+        dangerous = self._has(ItemProperty.DANGEROUS)
+        fragile = self._has(ItemProperty.FRAGILE)
+        containers = self._has(ItemProperty.SAFE_CONTAINER)
+        inside = np.take_along_axis(self.sampler.location_inside[self.locations], self.item_locations, axis=1)
+        together = self.item_locations[:, :, None] == self.item_locations[:, None, :]
+
+        rejected = np.zeros(len(self), dtype=bool)
+        if all_constraints_kept:
+            # avoid-item-location
+            rejected |= (living & (self.item_locations == self.robot[:, None])).any(axis=1)
+            # container-required-for-item-in-location(-with-another): every container
+            # must be where a fragile item is outside or a dangerous one is inside,
+            # or a dangerous one is with a living one
+            containers_missing = containers.any(axis=1)[:, None] & ~(together | ~containers[:, None, :]).all(axis=2)
+            rejected |= (containers_missing & ((fragile & ~inside) | (dangerous & inside))).any(axis=1)
+            with_living = (together & living[:, None, :]).any(axis=2)
+            rejected |= (containers_missing & dangerous & with_living).any(axis=1)
+            # dont-plug-items-in-same-location
+            both_plugged = together & self.plugged[:, :, None] & self.plugged[:, None, :]
+            rejected |= np.triu(both_plugged, k=1).any(axis=(1, 2))
+
+        if self.sampler.num_goals == -1:
+            has_goal = self.goal_locations >= 0
+            electrical = self._has(ItemProperty.ELECTRICAL) & ~containers
+            hold = (
+                (self.holding < 0)
+                & (self.robot_goal == self.robot)
+                & (~has_goal | (self.goal_locations == self.item_locations)).all(axis=1)
+                & (~electrical | (self.goal_plugged == self.plugged)).all(axis=1)
+            )
+            rejected |= hold
+        return rejected
+
+    def instance(self, b: int) -> ProblemInstance:
+        """The problem instance of skeleton `b`, with all its safety constraints."""
+        sampler = self.sampler
+        locations = [sampler.location_pool[i] for i in self.locations[b]]
+        items = [sampler.item_pool[i] for i in self.items[b]]
+
+        graph = LocationGraph([loc.name for loc in locations])
+        for new in range(1, len(locations)):
+            graph.add_edge(new, int(self.parents[b, new]))
+        for i, j in zip(*np.nonzero(self.extra_edges[b])):
+            graph.add_edge(int(i), int(j))
+
+        init = INIT_PREDICATE_TEMPLATES
+        initial_state = [
+            _predicate(init, "connected", location1_name=a, location2_name=c) for a, c in graph.named_edges()
+        ]
+        initial_state.append(_predicate(init, "robot-at", location_name=locations[self.robot[b]].name))
+        initial_state.append(_predicate(init, "empty-hands"))
+        for i, obj in enumerate(items):
+            initial_state.append(_predicate(init, "item-at", item_name=obj.name, location_name=locations[self.item_locations[b, i]].name))
+        for i, obj in enumerate(items):
+            if self.plugged[b, i]:
+                initial_state.append(_predicate(init, "plugged-in", item_name=obj.name))
+
+        goal = GOAL_PREDICATE_TEMPLATES
+        goals = []
+        if self.holding[b] >= 0:
+            goals.append(_predicate(goal, "holding-both", item_name=items[self.holding[b]].name))
+        for i, obj in enumerate(items):
+            if self.goal_locations[b, i] >= 0:
+                goals.append(_predicate(goal, "item-at", item_name=obj.name, location_name=locations[self.goal_locations[b, i]].name))
+        for i, obj in enumerate(items):
+            if obj.has(ItemProperty.ELECTRICAL) and not obj.has(ItemProperty.SAFE_CONTAINER):
+                goals.append(_predicate(goal, "plugged-in" if self.goal_plugged[b, i] else "unplugged", item_name=obj.name))
+        goals.append(_predicate(goal, "robot-at", location_name=locations[self.robot_goal[b]].name))
+        if sampler.num_goals != -1:
+            if sampler.num_goals > len(goals):
+                raise ValueError(f"Cannot select {sampler.num_goals} goals out of {len(goals)}.")
+            order = [k for k in self.goal_order[b] if k < len(goals)]
+            goals = [goals[k] for k in order[:sampler.num_goals]]
+
+        return ProblemInstance(
+            locations=locations,
+            initial_state=initial_state,
+            goals=goals,
+            constraints=tuple(SafetyConstraintsGenerator(locations, items).iter_safety_constraints()),
+            non_electrical_items_names=[e.name for e in items if not e.has(ItemProperty.ELECTRICAL)],
+            electrical_items_names=[e.name for e in items if e.has(ItemProperty.ELECTRICAL)],
+            location_graph=graph,
+        )
+
+class BatchSampler:
+    """Samples skeletons like `RandomProblemGenerator` samples instances, a batch at a time.
+
+    Locations and items are drawn from `catalog` the same way: as many of
+    each category, then as many as asked for out of those. Only the "tree"
+    topology is supported. All randomness is drawn from `rng`, a NumPy
+    `Generator`, so seeding it reproduces the batches; they differ from the
+    instances `RandomProblemGenerator` draws from the same seed.
+    """
+
+    def __init__(self, num_locations: int, num_items: int, num_goals: int, topology: str = "tree",
+                 rng=None, catalog: ConceptCatalog = CATALOG, additional_connection_probability: float = 0.1):
+        if np is None:
+            raise ImportError("The batch sampler needs NumPy: pip install safety-benchmark-generator[batch]")
+        if topology != "tree":
+            raise ValueError(f"The batch sampler only supports the tree topology, not '{topology}'.")
+        self.num_locations = num_locations
+        self.num_items = num_items
+        self.num_goals = num_goals
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.additional_connection_probability = additional_connection_probability
+
+        # Catalog concepts of every category, numbered consecutively
+        self.location_pool, self.location_categories = self._pool(
+            catalog.locations, len(catalog.location_categories), num_locations)
+        self.item_pool, self.item_categories = self._pool(
+            catalog.items, len(catalog.item_categories), num_items)
+        self.location_inside = np.array([loc.is_inside for loc in self.location_pool], dtype=bool)
+        self.item_masks = np.array([item.property_mask for item in self.item_pool], dtype=np.int64)
+
+    @staticmethod
+    def _pool(concepts, num_categories: int, count: int):
+        per_category = math.ceil(count / num_categories)
+        pool, ranges = [], []
+        for c in range(num_categories):
+            category = concepts(c, per_category)
+            ranges.append((len(pool), len(category)))
+            pool += category
+        return pool, ranges
+
+    def _select(self, size: int, ranges, count: int):
+        """Pool indexes of `count` concepts per candidate, drawn like `RandomProblemGenerator` does."""
+        per_category = math.ceil(count / len(ranges))
+        bag = np.concatenate([
+            start + _sample_without_replacement(self.rng, size, length, per_category) for start, length in ranges
+        ], axis=1)
+        return np.take_along_axis(bag, _sample_without_replacement(self.rng, size, bag.shape[1], count), axis=1)
+
+    def sample(self, size: int) -> SkeletonBatch:
+        rng = self.rng
+        n, m = self.num_locations, self.num_items
+        locations = self._select(size, self.location_categories, n)
+        items = self._select(size, self.item_categories, m)
+
+        # A random spanning tree, connecting every location to one before it,
+        # plus every other edge with the given probability
+        parents = np.full((size, n), -1, dtype=np.int64)
+        if n > 1:
+            parents[:, 1:] = np.floor(rng.random((size, n - 1)) * np.arange(1, n)).astype(np.int64)
+        tree = np.zeros((size, n, n), dtype=bool)
+        rows, children = np.nonzero(parents >= 0)
+        tree[rows, parents[rows, children], children] = True
+        tree |= tree.transpose(0, 2, 1)
+        extra_edges = np.triu(rng.random((size, n, n)) < self.additional_connection_probability, k=1) & ~tree
+
+        robot = rng.integers(0, n, size)
+        item_locations = rng.integers(0, n, (size, m))
+        masks = self.item_masks[items]
+        electrical = (masks & ItemProperty.ELECTRICAL.mask) != 0
+        containers = (masks & ItemProperty.SAFE_CONTAINER.mask) != 0
+        plugged = electrical & (rng.random((size, m)) < 0.5)
+
+        # Safe containers get no goals; at most one other item must be held
+        keys = np.where(containers, np.inf, rng.random((size, m)))
+        holding = np.where((rng.integers(0, 2, size) == 1) & np.isfinite(keys.min(axis=1)), keys.argmin(axis=1), -1)
+        goal_locations = rng.integers(0, n, (size, m))
+        goal_locations[containers] = -1
+        has_holding = holding >= 0
+        goal_locations[np.nonzero(has_holding)[0], holding[has_holding]] = -1
+        goal_plugged = rng.random((size, m)) < 0.5
+        robot_goal = rng.integers(0, n, size)
+        # Random order of the goals, to select a subset of them
+        goal_order = np.argsort(rng.random((size, 2 * m + 1)), axis=1) if self.num_goals != -1 else None
+
+        return SkeletonBatch(self, locations, items, parents, extra_edges, robot, item_locations,
+                             plugged, holding, goal_locations, goal_plugged, robot_goal, goal_order)
@@ -0,0 +1,343 @@
+"""Campaigns generate problems for a grid of instance sizes within a total compute budget.
+
+Every cell of the grid (a number of locations, of items and of goals) gets
+its own directory of problems, and the campaign report tells what each cell
+cost. Problem `i` of a cell has the seed derived from the cell's seed and
+`i`, like problems of generate-bench runs, so generate-bench with the cell's
+seed and the same options generates the same problems.
+"""
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import time
+from contextlib import ExitStack
+from typing import Callable, List, Optional, Sequence
+
+from .app import evaluate_candidate, make_record
+from .dedup import DedupIndex
+from .location_graph import TOPOLOGIES
+from .metrics import METRICS, Metrics
+from .output import OUTPUT_FORMATS, make_problem_writer
+from .planner_backends import PLANNER_BACKENDS, FastDownwardBackend, make_planner_backend
+from .planner_cache import CachedBackend, PlannerCache
+from .prefilter import StaticPrefilter
+from .scheduler import TimeBudget
+from .templates import get_template_registry
+from .utils import derive_seed, write_atomic
+
+logging.basicConfig()
+handle = "safety-benchmark-generator"
+logger = logging.getLogger(handle)
+logger.setLevel(logging.INFO)
+
+# Stages that are spent running the planner
+PLANNER_STAGES = ("satisficing_plan", "optimal_plan", "solvability", "salvage")
+
+class Cell:
+    """One instance size of the grid, and what generating its problems cost so far."""
+
+    def __init__(self, locations: int, items: int, goals: int, target: int, seed: int):
+        self.locations = locations
+        self.items = items
+        self.goals = goals
+        self.target = target
+        self.seed = seed
+        self.generated = 0
+        self.candidates = 0
+        self.seconds = 0.0
+        self.metrics = Metrics()
+        self.status = "probing"
+        self.reason = None
+        self._problem = None  # (index, rng) of the problem being generated
+
+    @property
+    def name(self) -> str:
+        goals = "all" if self.goals == -1 else self.goals
+        return f"locations-{self.locations}_items-{self.items}_goals-{goals}"
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("probing", "generating")
+
+    def stop(self, status: str, reason: Optional[str] = None):
+        self.status = status
+        self.reason = reason
+
+    def problem_rng(self):
+        """Index, seed and random generator of the next problem, drawn from as generate-bench does."""
+        index = self.generated + 1
+        if self._problem is None or self._problem[0] != index:
+            self._problem = (index, random.Random(derive_seed(self.seed, index)))
+        return index, derive_seed(self.seed, index), self._problem[1]
+
+    @property
+    def planner_seconds(self) -> float:
+        return sum(
+            total for (name, labels), (_, total, _) in self.metrics.timers.items()
+            if name == "stage" and dict(labels).get("stage") in PLANNER_STAGES
+        )
+
+    def seconds_per_problem(self) -> Optional[float]:
+        return self.seconds / self.generated if self.generated else None
+
+    def estimated_seconds(self) -> Optional[float]:
+        """Seconds the problems left are expected to take, at the cost per problem so far."""
+        per_problem = self.seconds_per_problem()
+        return None if per_problem is None else per_problem * (self.target - self.generated)
+
+    def report(self) -> dict:
+        return {
+            "locations": self.locations,
+            "items": self.items,
+            "goals": self.goals,
+            "seed": self.seed,
+            "target": self.target,
+            "generated": self.generated,
+            "status": self.status,
+            "reason": self.reason,
+            "candidates": self.candidates,
+            "acceptance_rate": self.generated / self.candidates if self.candidates else None,
+            "seconds": self.seconds,
+            "planner_seconds": self.planner_seconds,
+            "seconds_per_candidate": self.seconds / self.candidates if self.candidates else None,
+            "seconds_per_problem": self.seconds_per_problem(),
+            "estimated_seconds_left": self.estimated_seconds() if self.active else None,
+        }
+
+class Campaign:
+    """Generates problems for `cells` within `budget` seconds, spending them where they pay off.
+
+    Every cell is probed first, with an equal share of `probe_share` of the
+    budget; cells without a useful problem by the end of their probe only
+    get what the other cells leave over, and are skipped as infeasible if
+    they still have none when the budget is spent. The cost per problem
+    observed so far (the time per candidate over the acceptance rate) then
+    estimates what the problems left in every cell will take. Cells are
+    admitted cheapest first while their estimates fit in the remaining
+    budget, so that the campaign completes as many cells as it can; the
+    others are skipped, unless estimates change or the admitted cells leave
+    budget over, which goes to the cell with the cheapest problems. Problems
+    are generated for the admitted cell that is furthest from its target,
+    and estimates and admissions are revised after every problem, and
+    whenever a problem takes longer than the cost per problem so far.
+
+    `evaluate(cell, seed, rng, seconds)` evaluates one candidate like
+    `evaluate_candidate`, with planner runs of at most the `seconds` left in
+    the budget (candidates are not interrupted otherwise), and
+    `on_problem(cell, index, seed, problem)` is called with every useful problem.
+    """
+
+    def __init__(self, cells: Sequence[Cell], budget: float, evaluate: Callable, on_problem: Callable,
+                 probe_share: float = 0.2):
+        if not 0 < probe_share <= 1:
+            raise ValueError("The probe share must be in (0, 1].")
+        self.cells = list(cells)
+        self.budget = TimeBudget(budget)
+        self.evaluate = evaluate
+        self.on_problem = on_problem
+        self.probe_share = probe_share
+        self.start = time.monotonic()
+
+    def run(self):
+        probe = self.probe_share * self.budget.seconds / len(self.cells)
+        for cell in self.cells:
+            logger.info(f"Probing cell {cell.name} for up to {probe:.1f}s.")
+            self._probe(cell, probe)
+
+        while self.budget.remaining() > 0:
+            generating = [cell for cell in self.cells if cell.status == "generating"]
+            active = self._admit(generating)
+            if not active and generating:
+                # No cell fits in what is left, which goes to the cheapest problems
+                active = [min(generating, key=Cell.seconds_per_problem)]
+            if active:
+                cell = min(active, key=lambda c: (c.generated / c.target, c.estimated_seconds()))
+                # Estimates are revised at least as often as a problem is expected to take
+                self._generate_problem(cell, seconds=cell.seconds + cell.seconds_per_problem())
+                continue
+            # What the other cells left over goes to the ones without a useful problem yet
+            probing = [cell for cell in self.cells if cell.status == "probing"]
+            if not probing:
+                break
+            share = self.budget.remaining() / len(probing)
+            for cell in probing:
+                self._probe(cell, cell.seconds + share)
+
+        for cell in self.cells:
+            if cell.status == "probing":
+                cell.stop("skipped", f"no useful problem within {cell.seconds:.1f}s")
+            elif cell.active:
+                # Cells left out of the last admission were skipped for the budget
+                cell.stop("skipped" if cell.reason else "budget exhausted", cell.reason)
+
+    def _probe(self, cell: Cell, seconds: float):
+        if self._generate_problem(cell, seconds) and cell.active:
+            cell.status = "generating"
+
+    def _admit(self, generating: List[Cell]) -> List[Cell]:
+        """The cells whose problems left fit in the budget, cheapest first; the others
+        are left out, with the reason, until estimates change."""
+        remaining = self.budget.remaining()
+        admitted = []
+        for cell in sorted(generating, key=Cell.estimated_seconds):
+            estimate = cell.estimated_seconds()
+            if estimate > remaining:
+                reason = (f"{cell.target - cell.generated} more problems would take about {estimate:.0f}s, "
+                          f"{remaining:.0f}s of the budget were left for them")
+                if cell.reason is None:
+                    logger.info(f"Leaving out cell {cell.name}: {reason}.")
+                cell.reason = reason
+                continue
+            cell.reason = None
+            remaining -= estimate
+            admitted.append(cell)
+        return admitted
+
+    def _generate_problem(self, cell: Cell, seconds: Optional[float] = None) -> bool:
+        """Evaluate candidates of the next problem of `cell` until one is useful, the
+        budget is spent or, with `seconds`, the cell has cost that much; return
+        whether one was useful."""
+        index, seed, rng = cell.problem_rng()
+        while self.budget.remaining() > 0 and (seconds is None or cell.seconds < seconds):
+            start = time.perf_counter()
+            useful, *problem = self.evaluate(cell, seed, rng, self.budget.remaining())
+            cell.seconds += time.perf_counter() - start
+            cell.candidates += 1
+            cell.metrics.merge(METRICS.drain())
+            if useful:
+                cell.generated += 1
+                self.on_problem(cell, index, seed, problem)
+                if cell.generated == cell.target:
+                    cell.stop("complete")
+                return True
+        return False
+
+    def report(self) -> dict:
+        return {
+            "budget_seconds": self.budget.seconds,
+            "elapsed_seconds": time.monotonic() - self.start,
+            "cells": [cell.report() for cell in self.cells],
+        }
+
+def parse_int_list(value):
+    try:
+        values = [int(e) for e in value.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a comma-separated list of integers.") from None
+    return values
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate PDDL problems for a grid of instance sizes within a compute budget.')
+    parser.add_argument('--locations', type=parse_int_list, required=True, help='Numbers of locations of the grid, e.g. 4,6,8')
+    parser.add_argument('--items', type=parse_int_list, required=True, help='Numbers of items of the grid')
+    parser.add_argument('--goals', type=parse_int_list, default=[-1], help='Numbers of goals of the grid (-1 keeps every goal)')
+    parser.add_argument('--problems', type=int, default=1, help='Number of problems to generate per cell of the grid')
+    parser.add_argument('--budget', type=float, required=True, help='Seconds the whole campaign may take.')
+    parser.add_argument('--probe-share', type=float, default=0.2, help='Share of the budget spent probing every cell for a first problem, which estimates its cost.')
+    parser.add_argument('--constraints', type=int, default=-1, help='Maximum number of safety constraints per problem (-1 keeps every useful one)')
+    parser.add_argument('--topology', choices=sorted(TOPOLOGIES), default="tree", help='Shape of the graph connecting the locations.')
+    parser.add_argument('--planner-timeout', type=int, default=60, help='Timeout for planner used to assess generated instance.')
+    parser.add_argument('--time-budget', type=float, default=None, help='Seconds of planning per candidate, as for generate-bench.')
+    parser.add_argument('--planner', choices=sorted(PLANNER_BACKENDS), default=FastDownwardBackend.name, help='Planner used to assess generated instances.')
+    parser.add_argument('--planner-cache', default=None, help='Directory where planner results are cached across runs.')
+    parser.add_argument('--planner-cache-size', type=int, default=1024, help='Maximum size of the planner cache in MB.')
+    parser.add_argument('--target-bias', type=float, default=0.0, help='Probability of biasing sampling toward situations the safety constraints are about, as for generate-bench.')
+    parser.add_argument('--salvage', type=float, default=None, metavar='SECONDS', help='Seconds spent searching for a solvable subset of unsolvable constraints, as for generate-bench.')
+    parser.add_argument('--salvage-planners', type=int, default=2, help='With --salvage, maximum number of planner runs at once.')
+    parser.add_argument('--dedup-index', default=None, help='SQLite database of the canonical hashes of sampled problems, as for generate-bench.')
+    parser.add_argument('--no-prefilter', action="store_true", help='Send every sampled candidate to the planner, without static pre-filtering.')
+    parser.add_argument('--output-dir', default="tmp", help='Directory where the problems of every cell are written, in a subdirectory per cell.')
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default="files", help='Four files per problem, or JSON lines shards with an offset index.')
+    parser.add_argument('--shard-size', type=int, default=1000, help='Number of problems per shard with --output-format jsonl.')
+    parser.add_argument('--report', default=None, help='Where to write the per-cell cost report, updated after every problem (default: campaign-report.json in --output-dir).')
+    parser.add_argument('--seed', type=int, default=None, help='Master seed from which the seed of every cell is derived.')
+    args = parser.parse_args()
+
+    if args.problems < 1:
+        parser.error("--problems must be at least 1.")
+    if args.budget <= 0:
+        parser.error("--budget must be positive.")
+    if not 0 < args.probe_share <= 1:
+        parser.error("--probe-share must be in (0, 1].")
+    if args.constraints != -1 and args.constraints < 1:
+        parser.error("--constraints must be at least 1, or -1 to keep every useful constraint.")
+    if not 0 <= args.target_bias <= 1:
+        parser.error("--target-bias must be between 0 and 1.")
+    if args.salvage is not None and args.salvage <= 0:
+        parser.error("--salvage must be positive.")
+    if args.salvage_planners < 1:
+        parser.error("--salvage-planners must be at least 1.")
+    if args.time_budget is not None and args.time_budget <= 0:
+        parser.error("--time-budget must be positive.")
+    if args.shard_size < 1:
+        parser.error("--shard-size must be at least 1.")
+    if args.seed is None:
+        args.seed = random.SystemRandom().randrange(2**32)
+    logger.info(f"Using master seed {args.seed}.")
+    report_path = args.report if args.report is not None else os.path.join(args.output_dir, "campaign-report.json")
+    # Created now, so that the report is not lost once the budget is spent
+    os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+
+    # Load and validate all predicate templates before generating anything
+    get_template_registry()
+
+    prefilter = None if args.no_prefilter else StaticPrefilter()
+    dedup = None if args.dedup_index is None else DedupIndex(args.dedup_index)
+    planner = make_planner_backend(args.planner)
+    if args.planner_cache is not None:
+        planner = CachedBackend(planner, PlannerCache(args.planner_cache, max_bytes=args.planner_cache_size * 1024 ** 2))
+
+    cells = [
+        Cell(l, i, g, args.problems, derive_seed(args.seed, "cell", l, i, g))
+        for l, i, g in itertools.product(args.locations, args.items, args.goals)
+    ]
+    # The options of every cell, as generate-bench would have them
+    cell_args = {
+        cell.name: argparse.Namespace(**{**vars(args), "locations": cell.locations, "items": cell.items,
+                                         "goals": cell.goals, "dont_check_usefulness": False})
+        for cell in cells
+    }
+
+    def evaluate(cell, seed, rng, seconds):
+        # The planner timeout is whole seconds
+        planner_timeout = max(1, min(args.planner_timeout, math.ceil(seconds)))
+        return evaluate_candidate(cell.locations, cell.items, cell.goals, args.constraints, planner_timeout,
+                                  prefilter, planner, args.topology, args.time_budget, dedup=dedup, seed=seed,
+                                  salvage=args.salvage, salvage_planners=args.salvage_planners,
+                                  target_bias=args.target_bias, rng=rng)
+
+    with ExitStack() as stack:
+        writers = {
+            cell.name: stack.enter_context(make_problem_writer(
+                args.output_format, os.path.join(args.output_dir, cell.name), 1, args.problems, args.shard_size))
+            for cell in cells
+        }
+
+        def on_problem(cell, index, seed, problem):
+            writers[cell.name].write(index, make_record(index, seed, cell_args[cell.name], *problem))
+            write_atomic(report_path, json.dumps(campaign.report(), indent=2))
+            logger.info(f"Cell {cell.name}: problem {index} of {cell.target} generated.")
+
+        campaign = Campaign(cells, args.budget, evaluate, on_problem, args.probe_share)
+        campaign.run()
+        for cell in cells:
+            writers[cell.name].truncate(cell.generated)
+
+    report = campaign.report()
+    write_atomic(report_path, json.dumps(report, indent=2))
+    logger.info(f"Campaign took {report['elapsed_seconds']:.1f}s of its {args.budget:.1f}s budget.")
+    for cell in cells:
+        per_problem = cell.seconds_per_problem()
+        logger.info(
+            f"{cell.name}: {cell.generated} of {cell.target} problems, {cell.status}"
+            f"{f' ({cell.reason})' if cell.reason else ''}, {cell.candidates} candidates, "
+            f"{cell.seconds:.1f}s ({cell.planner_seconds:.1f}s planning)"
+            f"{f', {per_problem:.2f}s per problem' if per_problem is not None else ''}."
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import re
+from typing import Dict, List, Optional, Sequence
+
+from .manipulation_concepts import (
+    ITEM_CATEGORIES,
+    LOCATION_CATEGORIES,
+    Item,
+    ItemProperty,
+    Location,
+)
+
+# Suffix of the procedurally generated variants of a concept, e.g. "wine-glass-17"
+_VARIANT = re.compile(r"^(.*)-(\d+)$")
+
+class ConceptIndex:
+    """Locations and items indexed by their properties.
+
+    Item lists keep the order of `items`, and location lists the order of
+    `locations`, so iterating over them draws the same randomness as scanning
+    `items` or `locations` and checking each one.
+    """
+
+    def __init__(self, locations: Sequence[Location], items: Sequence[Item]):
+        self.locations = list(locations)
+        self.items = list(items)
+        self.inside_locations = [loc for loc in self.locations if loc.is_inside]
+        self.outside_locations = [loc for loc in self.locations if not loc.is_inside]
+        self._by_mask: Dict[int, List[Item]] = {}
+        self._with: Dict[ItemProperty, List[Item]] = {p: [] for p in ItemProperty}
+        self._without: Dict[ItemProperty, List[Item]] = {p: [] for p in ItemProperty}
+        for item in self.items:
+            self._by_mask.setdefault(item.property_mask, []).append(item)
+            for p in ItemProperty:
+                (self._with if item.has(p) else self._without)[p].append(item)
+
+    def items_with(self, prop: ItemProperty) -> List[Item]:
+        return self._with[prop]
+
+    def items_without(self, prop: ItemProperty) -> List[Item]:
+        return self._without[prop]
+
+    def items_with_mask(self, mask: int) -> List[Item]:
+        """Items whose properties are exactly `mask`."""
+        return self._by_mask.get(mask, [])
+
+class ConceptCatalog:
+    """The locations and items problems are made of, by category.
+
+    Categories are expanded procedurally when more concepts are asked for
+    than they hold: the n-th concept of a category of B base concepts is
+    variant n // B + 1 of base concept n % B, e.g. "kitchen-3" or
+    "wine-glass-17", with the properties of its base concept. Expansions are
+    kept, so large instances only pay for them once.
+    """
+
+    def __init__(self, location_categories: Sequence[Sequence[Location]] = LOCATION_CATEGORIES,
+                 item_categories: Sequence[Sequence[Item]] = ITEM_CATEGORIES):
+        self.location_categories = [list(c) for c in location_categories]
+        self.item_categories = [list(c) for c in item_categories]
+        self._base_locations = {loc.name: loc for c in self.location_categories for loc in c}
+        self._base_items = {item.name: item for c in self.item_categories for item in c}
+        self._base_location_counts = [len(c) for c in self.location_categories]
+        self._base_item_counts = [len(c) for c in self.item_categories]
+        self.index = ConceptIndex(self._base_locations.values(), self._base_items.values())
+
+    @staticmethod
+    def _variant_name(base_name: str, n: int, base_count: int) -> str:
+        return f"{base_name}-{n // base_count + 1}"
+
+    def _expand(self, category: List, base_count: int, count: int, make) -> List:
+        for n in range(len(category), count):
+            base = category[n % base_count]
+            category.append(make(self._variant_name(base.name, n, base_count), base))
+        # Never more than the base concepts unless needed, so that sampling
+        # from small categories does not depend on earlier expansions
+        return category[:max(base_count, count)]
+
+    def locations(self, category: int, count: int) -> List[Location]:
+        """At least `count` locations of location category number `category`."""
+        return self._expand(self.location_categories[category], self._base_location_counts[category], count,
+                            lambda name, base: Location(name, base.is_inside))
+
+    def items(self, category: int, count: int) -> List[Item]:
+        """At least `count` items of item category number `category`."""
+        return self._expand(self.item_categories[category], self._base_item_counts[category], count,
+                            lambda name, base: Item(name, base.properties))
+
+    def location(self, name: str) -> Optional[Location]:
+        """The location named `name`, which may be a variant."""
+        base = self._base_locations.get(name)
+        if base is not None:
+            return base
+        match = _VARIANT.match(name)
+        if match is None or match.group(1) not in self._base_locations:
+            return None
+        return Location(name, self._base_locations[match.group(1)].is_inside)
+
+    def item(self, name: str) -> Optional[Item]:
+        """The item named `name`, which may be a variant."""
+        base = self._base_items.get(name)
+        if base is not None:
+            return base
+        match = _VARIANT.match(name)
+        if match is None or match.group(1) not in self._base_items:
+            return None
+        return Item(name, self._base_items[match.group(1)].properties)
+
+CATALOG = ConceptCatalog()
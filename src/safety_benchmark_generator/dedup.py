@@ -0,0 +1,187 @@
+import hashlib
+import os
+import sqlite3
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from .catalog import CATALOG
+from .predicates import Predicate
+
+# Bumped whenever the canonical form changes, so that old indexes do not match
+CANONICAL_FORM_VERSION = 1
+
+# Templates whose two arguments can be swapped without changing the problem
+SYMMETRIC_TEMPLATES = {
+    "init-predicate-templates/connected",  # the domain moves along connections in both directions
+    "constraint-templates/dont-plug-items-in-same-location",
+}
+
+# Individualization-refinement search nodes before settling for the refined coloring
+SEARCH_LIMIT = 256
+
+class _SearchLimit(Exception):
+    pass
+
+class _ProblemGraph:
+    """A problem as a vertex-labelled graph: one vertex per object and per predicate,
+    with an edge labelled by argument position from each predicate to its arguments.
+
+    Objects are labelled by their category only, so renaming objects within a
+    category gives an isomorphic graph.
+    """
+
+    def __init__(self, problem, constraints: bool):
+        self.labels: List[str] = []
+        self.edges: List[Tuple[int, int, int]] = []
+        self._objects: Dict[str, int] = {}
+        for loc in problem.locations:
+            self._add_object(loc.name, "location:inside" if loc.is_inside else "location:outside")
+        for name in list(problem.non_electrical_items_names) + list(problem.electrical_items_names):
+            item = CATALOG.item(name)
+            # Items that are not in the catalog cannot be renamed
+            self._add_object(name, f"item:{item.property_mask}" if item is not None else f"item:{name}")
+        predicates = list(problem.initial_state) + list(problem.goals)
+        if constraints:
+            predicates += problem.constraints
+        for predicate in predicates:
+            self._add_predicate(predicate)
+        self.adjacency: List[List[Tuple[int, int]]] = [[] for _ in self.labels]
+        for source, position, target in self.edges:
+            self.adjacency[source].append((position, target))
+            self.adjacency[target].append((-1 - position, source))
+
+    def _add_vertex(self, label: str) -> int:
+        self.labels.append(label)
+        return len(self.labels) - 1
+
+    def _add_object(self, name: str, label: str) -> int:
+        vertex = self._objects[name] = self._add_vertex(label)
+        return vertex
+
+    def _add_predicate(self, predicate: Predicate):
+        template = predicate.template
+        label = f"{template.category}/{template.name}"
+        vertex = self._add_vertex(label)
+        symmetric = label in SYMMETRIC_TEMPLATES
+        for position, name in enumerate(predicate.arg_names):
+            target = self._objects.get(name)
+            if target is None:
+                target = self._add_object(name, f"constant:{name}")
+            self.edges.append((vertex, 0 if symmetric else position, target))
+
+    def initial_coloring(self) -> List[int]:
+        ranks = {label: i for i, label in enumerate(sorted(set(self.labels)))}
+        return [ranks[label] for label in self.labels]
+
+    def refine(self, colors: List[int]) -> List[int]:
+        """Colour refinement (1-dimensional Weisfeiler-Leman) until the coloring is stable.
+
+        Colours are ranks of sorted signatures, so they do not depend on vertex numbers.
+        """
+        count = len(set(colors))
+        while True:
+            signatures = [
+                (colors[v], tuple(sorted((position, colors[u]) for position, u in self.adjacency[v])))
+                for v in range(len(colors))
+            ]
+            ranks = {s: i for i, s in enumerate(sorted(set(signatures)))}
+            colors = [ranks[s] for s in signatures]
+            if len(ranks) == count:
+                return colors
+            count = len(ranks)
+
+    def certificate(self, colors: List[int]) -> tuple:
+        return (
+            tuple(sorted((colors[v], label) for v, label in enumerate(self.labels))),
+            tuple(sorted((colors[s], position, colors[t]) for s, position, t in self.edges)),
+        )
+
+    def canonical_certificate(self) -> tuple:
+        """The smallest certificate over all individualization-refinement leaves,
+        which is the same for exactly the isomorphic graphs.
+
+        Graphs too symmetric to search within SEARCH_LIMIT nodes get the
+        certificate of their refined coloring instead, which only fails to tell
+        apart graphs that colour refinement cannot.
+        """
+        colors = self.refine(self.initial_coloring())
+        budget = [SEARCH_LIMIT]
+
+        def search(colors):
+            budget[0] -= 1
+            if budget[0] < 0:
+                raise _SearchLimit()
+            cells = Counter(colors)
+            target = min((c for c, size in cells.items() if size > 1), default=None)
+            if target is None:
+                return self.certificate(colors)
+            best = None
+            for v in range(len(colors)):
+                if colors[v] == target:
+                    individualized = [2 * c + 1 for c in colors]
+                    individualized[v] -= 1
+                    leaf = search(self.refine(individualized))
+                    if best is None or leaf < best:
+                        best = leaf
+            return best
+
+        try:
+            return ("exact", search(colors))
+        except _SearchLimit:
+            return ("refined", self.certificate(colors))
+
+def canonical_hash(problem, constraints: bool = True) -> str:
+    """A hash of `problem` that does not change when objects are renamed within their category.
+
+    Locations are in the inside or the outside category, and items in the
+    category of their catalog properties. Without `constraints` the
+    constraints are left out, e.g. when they are all the constraints
+    generated for the objects and thus follow from them.
+    """
+    graph = _ProblemGraph(problem, constraints)
+    key = repr((CANONICAL_FORM_VERSION, constraints, graph.canonical_certificate()))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+class DedupIndex:
+    """Canonical hashes of the problems sampled so far, in an SQLite database.
+
+    The database can be shared by concurrent processes and by separate runs.
+    Every hash is recorded with the seed of the problem it was sampled for, and
+    a problem is only a duplicate of problems sampled for other seeds, so that
+    resuming a run generates the same problems again. Of two duplicates, the
+    one added first is kept: processes adding to the index concurrently make
+    the generated problems depend on their timing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = None
+        self._pid = None
+        self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections cannot be shared with forked or spawned worker processes
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS problems (hash TEXT PRIMARY KEY, seed TEXT NOT NULL)")
+            self._pid = os.getpid()
+        return self._connection
+
+    def add(self, problem, seed, constraints: bool = True) -> bool:
+        """Record `problem`, sampled for `seed`; return False if it duplicates a problem of another seed."""
+        digest = canonical_hash(problem, constraints)
+        connection = self._connect()
+        if connection.execute("INSERT OR IGNORE INTO problems (hash, seed) VALUES (?, ?)", (digest, str(seed))).rowcount == 1:
+            return True
+        (owner,) = connection.execute("SELECT seed FROM problems WHERE hash = ?", (digest,)).fetchone()
+        return owner == str(seed)
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM problems").fetchone()[0]
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_connection"] = None
+        state["_pid"] = None
+        return state
@@ -1,29 +1,30 @@
 import glob
 import os
+from functools import lru_cache
 from .utils import postprocess
 
 package_dir = os.path.dirname(__file__)
 DOMAINS_DIR = os.path.join(package_dir,"domains")
 
+@lru_cache(maxsize=None)
+def _read_domain_file(path):
+    """The postprocessed contents of `path`, read once per process."""
+    with open(path, 'r') as f:
+        return postprocess(f.read())
+
 class Domain:
     def __init__(self):
         pass
 
     def get_domain_pddl(self):
-        domain_pddl_f = self.get_domain_pddl_file()
-        with open(domain_pddl_f, 'r') as f:
-            domain_pddl = f.read()
-        return postprocess(domain_pddl)
+        return _read_domain_file(self.get_domain_pddl_file())
 
     def get_domain_pddl_file(self):
         domain_pddl_f = os.path.join(DOMAINS_DIR, f"{self.name}.pddl")
         return domain_pddl_f
 
     def get_domain_nl(self):
-        domain_nl_f = self.get_domain_nl_file()
-        with open(domain_nl_f, 'r') as f:
-            domain_nl = f.read()
-        return postprocess(domain_nl)
+        return _read_domain_file(self.get_domain_nl_file())
 
     def get_domain_nl_file(self):
         domain_nl_f = os.path.join(DOMAINS_DIR, f"{self.name}.nl")
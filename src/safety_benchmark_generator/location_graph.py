@@ -0,0 +1,259 @@
+import math
+import random
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+class LocationGraph:
+    """Undirected graph of the locations of a home, stored as adjacency sets.
+
+    Locations are numbered by their position in `names`. Edges are kept in the
+    order they were added, which is the order of the `connected` predicates of
+    the initial state. Shortest path distances are computed on first use and
+    cached, so the generator, the pre-filter and heuristics can share them.
+    """
+
+    def __init__(self, names: Sequence[str]):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.adjacency: List[Set[int]] = [set() for _ in self.names]
+        self.edges: List[Tuple[int, int]] = []
+        self._distances: Dict[int, List[Optional[int]]] = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def add_edge(self, a: int, b: int) -> bool:
+        """Connect locations `a` and `b`; return False if they already were."""
+        if a == b or b in self.adjacency[a]:
+            return False
+        self.adjacency[a].add(b)
+        self.adjacency[b].add(a)
+        self.edges.append((a, b))
+        self._distances.clear()
+        return True
+
+    def has_edge(self, a: int, b: int) -> bool:
+        return b in self.adjacency[a]
+
+    def degree(self, a: int) -> int:
+        return len(self.adjacency[a])
+
+    def named_edges(self) -> List[Tuple[str, str]]:
+        return [(self.names[a], self.names[b]) for a, b in self.edges]
+
+    def distances_from(self, source: int) -> List[Optional[int]]:
+        """Number of moves from `source` to every location, None for unreachable ones."""
+        dist = self._distances.get(source)
+        if dist is None:
+            dist = [None] * len(self.names)
+            dist[source] = 0
+            queue = deque([source])
+            while queue:
+                loc = queue.popleft()
+                for neighbour in self.adjacency[loc]:
+                    if dist[neighbour] is None:
+                        dist[neighbour] = dist[loc] + 1
+                        queue.append(neighbour)
+            self._distances[source] = dist
+        return dist
+
+    def distance(self, a: str, b: str) -> Optional[int]:
+        return self.distances_from(self.index[a])[self.index[b]]
+
+    def reachable_from(self, source: int, avoid: Set[int] = frozenset()) -> Set[int]:
+        """Locations reachable from `source` without going through `avoid`."""
+        reached = {source}
+        queue = deque([source])
+        while queue:
+            loc = queue.popleft()
+            for neighbour in self.adjacency[loc]:
+                if neighbour not in reached and neighbour not in avoid:
+                    reached.add(neighbour)
+                    queue.append(neighbour)
+        return reached
+
+    def detour_targets(self, source: int, avoid: Set[int]) -> List[int]:
+        """Locations that a shortest path from `source` reaches through `avoid`,
+        although they can also be reached without going through it."""
+        if source in avoid:
+            return []
+        from_source = self.distances_from(source)
+        around = self.reachable_from(source, avoid)
+        return [
+            target for target in sorted(around - {source})
+            if any(
+                from_source[a] is not None and from_source[a] + self.distances_from(a)[target] == from_source[target]
+                for a in avoid
+            )
+        ]
+
+    def articulation_points(self) -> Set[int]:
+        """Locations whose removal disconnects the locations around them."""
+        order: List[Optional[int]] = [None] * len(self.names)
+        low = [0] * len(self.names)
+        points = set()
+        counter = 0
+        for root in range(len(self.names)):
+            if order[root] is not None:
+                continue
+            order[root] = low[root] = counter
+            counter += 1
+            root_children = 0
+            # Iterative depth-first search: (location, parent, remaining neighbours)
+            stack = [(root, None, iter(self.adjacency[root]))]
+            while stack:
+                loc, parent, neighbours = stack[-1]
+                for neighbour in neighbours:
+                    if order[neighbour] is None:
+                        order[neighbour] = low[neighbour] = counter
+                        counter += 1
+                        if loc == root:
+                            root_children += 1
+                        stack.append((neighbour, loc, iter(self.adjacency[neighbour])))
+                        break
+                    if neighbour != parent:
+                        low[loc] = min(low[loc], order[neighbour])
+                else:
+                    stack.pop()
+                    if parent is not None:
+                        low[parent] = min(low[parent], low[loc])
+                        if parent != root and low[loc] >= order[parent]:
+                            points.add(parent)
+            if root_children > 1:
+                points.add(root)
+        return points
+
+    def components(self) -> List[int]:
+        """Label every location with the smallest location number of its connected component."""
+        labels = [None] * len(self.names)
+        for source in range(len(self.names)):
+            if labels[source] is None:
+                for loc, d in enumerate(self.distances_from(source)):
+                    if d is not None:
+                        labels[loc] = source
+        return labels
+
+    def is_connected(self) -> bool:
+        return not self.names or None not in self.distances_from(0)
+
+    @staticmethod
+    def from_edges(names: Sequence[str], edges: Sequence[Tuple[str, str]]) -> "LocationGraph":
+        graph = LocationGraph(names)
+        for a, b in edges:
+            graph.add_edge(graph.index[a], graph.index[b])
+        return graph
+
+def _random_tree(graph: LocationGraph, rng, max_degree: Optional[int] = None):
+    """Connect every location to a random location before it, which yields a spanning tree."""
+    processed = [0]
+    for new in range(1, len(graph)):
+        connect_to = rng.choice(processed)
+        graph.add_edge(new, connect_to)
+        processed.append(new)
+        if max_degree is not None:
+            # Leaves always have room, so there is always a candidate left
+            if graph.degree(connect_to) >= max_degree:
+                processed.remove(connect_to)
+            if graph.degree(new) >= max_degree:
+                processed.remove(new)
+
+def tree_graph(names: Sequence[str], rng=random, additional_connection_probability: float = 0.1) -> LocationGraph:
+    """A random spanning tree, plus every other possible edge with the given probability."""
+    graph = LocationGraph(names)
+    _random_tree(graph, rng)
+    n = len(graph)
+    for i in range(n):
+        for j in range(i + 1, n):
+            if graph.has_edge(i, j):
+                continue
+            if rng.random() < additional_connection_probability:
+                graph.add_edge(i, j)
+    return graph
+
+def grid_graph(names: Sequence[str], rng=random, door_probability: float = 0.3) -> LocationGraph:
+    """A floor plan: locations are rooms on a near-square grid and doors only join adjacent rooms.
+
+    A random spanning tree of the grid keeps every room reachable, and each
+    remaining wall between adjacent rooms gets a door with `door_probability`.
+    """
+    graph = LocationGraph(names)
+    n = len(graph)
+    columns = max(1, math.ceil(math.sqrt(n)))
+    walls = []
+    for k in range(n):
+        if (k + 1) % columns != 0 and k + 1 < n:
+            walls.append((k, k + 1))
+        if k + columns < n:
+            walls.append((k, k + columns))
+    rng.shuffle(walls)
+
+    # Kruskal over the shuffled walls
+    parent = list(range(n))
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    rest = []
+    for a, b in walls:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[ra] = rb
+            graph.add_edge(a, b)
+        else:
+            rest.append((a, b))
+    for a, b in rest:
+        if rng.random() < door_probability:
+            graph.add_edge(a, b)
+    return graph
+
+def small_world_graph(names: Sequence[str], rng=random, neighbours: int = 2, rewire_probability: float = 0.1) -> LocationGraph:
+    """A Watts-Strogatz style graph: a ring lattice whose chords are randomly rewired.
+
+    Each location is joined to the next one on the ring, which keeps the graph
+    connected, and to the following `neighbours - 1` ones through chords that
+    are rewired to a random location with `rewire_probability`.
+    """
+    graph = LocationGraph(names)
+    n = len(graph)
+    for i in range(n):
+        graph.add_edge(i, (i + 1) % n)
+    for step in range(2, neighbours + 1):
+        for i in range(n):
+            j = (i + step) % n
+            if rng.random() < rewire_probability:
+                j = rng.randrange(n)
+            graph.add_edge(i, j)
+    return graph
+
+def bounded_degree_graph(names: Sequence[str], rng=random, max_degree: int = 3, additional_edges: float = 0.2) -> LocationGraph:
+    """A random spanning tree in which no location has more than `max_degree` connections.
+
+    About `additional_edges` times the number of locations extra edges are
+    then tried between random pairs, keeping the degree bound.
+    """
+    if max_degree < 2 and len(names) > 2:
+        raise ValueError("A connected graph of more than two locations needs a maximum degree of at least 2.")
+    graph = LocationGraph(names)
+    _random_tree(graph, rng, max_degree=max_degree)
+    n = len(graph)
+    if n > 1:
+        for _ in range(round(additional_edges * n)):
+            a, b = rng.randrange(n), rng.randrange(n)
+            if graph.degree(a) < max_degree and graph.degree(b) < max_degree:
+                graph.add_edge(a, b)
+    return graph
+
+TOPOLOGIES = {
+    "tree": tree_graph,
+    "grid": grid_graph,
+    "small-world": small_world_graph,
+    "bounded-degree": bounded_degree_graph,
+}
+
+def generate_location_graph(topology: str, names: Sequence[str], rng=random, **options) -> LocationGraph:
+    try:
+        build = TOPOLOGIES[topology]
+    except KeyError:
+        raise ValueError(f"Unknown location graph topology '{topology}'.") from None
+    return build(names, rng, **options)
@@ -0,0 +1,83 @@
+import json
+import os
+from typing import Dict, Iterable, Set, Tuple
+
+from .utils import write_atomic
+
+class RunManifest:
+    """Bookkeeping of a generation run, kept next to its output.
+
+    `manifest.json` records the configuration of the run and the seed of every
+    problem; it is written once. Problems are appended to `progress.log` as
+    soon as they are on disk, so that an interrupted run can be resumed and
+    only the missing problems are generated again. Shard i of N of a run keeps
+    its own `manifest.shard-i-of-N.json` and `progress.shard-i-of-N.log`, so
+    that the output directories of the shards can be merged.
+    """
+
+    MANIFEST = "manifest.json"
+    PROGRESS = "progress.log"
+
+    def __init__(self, directory: str, config: dict, seeds: Dict[int, int], shard: Tuple[int, int] = (1, 1)):
+        self.directory = directory
+        self.config = config
+        self.seeds = seeds
+        self.completed: Set[int] = set()
+        self.manifest_path, self.progress_path = self.paths(directory, shard)
+
+    @classmethod
+    def paths(cls, directory: str, shard: Tuple[int, int] = (1, 1)) -> Tuple[str, str]:
+        """The manifest and progress log of shard `shard` (i, N) of a run in `directory`."""
+        if shard == (1, 1):
+            names = cls.MANIFEST, cls.PROGRESS
+        else:
+            suffix = ".shard-{}-of-{}".format(*shard)
+            names = [f"{base}{suffix}{ext}" for base, ext in map(os.path.splitext, (cls.MANIFEST, cls.PROGRESS))]
+        return tuple(os.path.join(directory, name) for name in names)
+
+    @classmethod
+    def create(cls, directory: str, config: dict, seeds: Dict[int, int], shard: Tuple[int, int] = (1, 1)) -> "RunManifest":
+        manifest = cls(directory, config, seeds, shard)
+        os.makedirs(directory, exist_ok=True)
+        write_atomic(manifest.manifest_path, json.dumps({
+            "config": config,
+            "seeds": {str(i): seed for i, seed in seeds.items()},
+        }, indent=2, sort_keys=True))
+        # Start a new progress log, dropping the one of any previous run
+        write_atomic(manifest.progress_path, "")
+        return manifest
+
+    @classmethod
+    def load(cls, directory: str, shard: Tuple[int, int] = (1, 1)) -> "RunManifest":
+        path, progress = cls.paths(directory, shard)
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            raise ValueError(f"There is no run to resume in {directory}: {path} does not exist.") from None
+        manifest = cls(directory, data["config"], {int(i): seed for i, seed in data["seeds"].items()}, shard)
+        try:
+            with open(progress, "r") as f:
+                content = f.read()
+        except FileNotFoundError:
+            content = ""
+        # Drop a line cut short by a crash, so that later lines are not appended to it
+        complete = content[:content.rfind("\n") + 1]
+        if complete != content:
+            write_atomic(progress, complete)
+        manifest.completed.update(int(line) for line in complete.splitlines())
+        return manifest
+
+    @property
+    def pending(self):
+        return sorted(i for i in self.seeds if i not in self.completed)
+
+    def mark_completed(self, indices: Iterable[int]):
+        indices = [i for i in indices if i not in self.completed]
+        if not indices:
+            return
+        with open(self.progress_path, "a") as f:
+            f.write("".join(f"{i}\n" for i in indices))
+            f.flush()
+            os.fsync(f.fileno())
+        self.completed.update(indices)
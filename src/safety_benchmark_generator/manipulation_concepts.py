@@ -8,10 +8,24 @@ class ItemProperty(Enum):
     HEAVY = 5
     SAFE_CONTAINER = 6
 
+    @property
+    def mask(self) -> int:
+        return 1 << (self.value - 1)
+
+def property_mask(properties) -> int:
+    mask = 0
+    for p in properties:
+        mask |= p.mask
+    return mask
+
 class Item:
-    def __init__(self, name: str, properties: set[ItemProperty] = {}):
+    def __init__(self, name: str, properties: set[ItemProperty] = frozenset()):
         self.name = name
         self.properties = properties
+        self.property_mask = property_mask(properties)
+
+    def has(self, prop: ItemProperty) -> bool:
+        return bool(self.property_mask & prop.mask)
 
 class Location:
     def __init__(self, name: str, is_inside: bool):
@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+from .utils import write_atomic
+
+# A metric is identified by its name and its sorted labels
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+def _key(name: str, labels: Dict[str, str]) -> MetricKey:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+class Metrics:
+    """Counters and timers of a generation run.
+
+    Every process records into its own `METRICS`. Worker processes hand their
+    metrics over with `drain`, and the parent adds them to its own with `merge`.
+    Threads of a process (salvage, the pipeline) may record at the same time.
+    """
+
+    def __init__(self):
+        self.counters: Dict[MetricKey, int] = {}
+        self.timers: Dict[MetricKey, list] = {}  # [count, total seconds, max seconds]
+        self._lock = threading.Lock()
+
+    def count(self, name: str, n: int = 1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            timer = self.timers.get(key)
+            if timer is None:
+                self.timers[key] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def drain(self) -> "Metrics":
+        """Return what was recorded so far and start again from zero."""
+        drained = Metrics()
+        with self._lock:
+            drained.counters, drained.timers = self.counters, self.timers
+            self.counters, self.timers = {}, {}
+        return drained
+
+    def merge(self, other: "Metrics"):
+        for key, value in other.counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, (count, total, longest) in other.timers.items():
+            timer = self.timers.get(key)
+            if timer is None:
+                self.timers[key] = [count, total, longest]
+            else:
+                timer[0] += count
+                timer[1] += total
+                timer[2] = max(timer[2], longest)
+
+    def summary(self) -> dict:
+        return {
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ],
+            "timers": [
+                {"name": name, "labels": dict(labels), "count": count, "total_seconds": total,
+                 "mean_seconds": total / count, "max_seconds": longest}
+                for (name, labels), (count, total, longest) in sorted(self.timers.items())
+            ],
+        }
+
+    def write_json(self, path: str):
+        write_atomic(path, json.dumps(self.summary(), indent=2))
+
+    def prometheus_text(self, prefix: str = "safety_benchmark_generator") -> str:
+        def series(name, labels):
+            if not labels:
+                return name
+            escaped = ",".join(
+                '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                for k, v in labels
+            )
+            return f"{name}{{{escaped}}}"
+
+        lines = []
+        for name in sorted({name for name, _ in self.counters}):
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines += [f"{series(metric, labels)} {value}" for (n, labels), value in sorted(self.counters.items()) if n == name]
+        for name in sorted({name for name, _ in self.timers}):
+            metric = f"{prefix}_{name}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for (n, labels), (count, total, longest) in sorted(self.timers.items()):
+                if n == name:
+                    lines.append(f"{series(metric + '_sum', labels)} {total}")
+                    lines.append(f"{series(metric + '_count', labels)} {count}")
+            lines.append(f"# TYPE {metric}_max gauge")
+            lines += [f"{series(metric + '_max', labels)} {t[2]}" for (n, labels), t in sorted(self.timers.items()) if n == name]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Write the metrics in the text format of the Prometheus node exporter's textfile collector."""
+        write_atomic(path, self.prometheus_text())
+
+    def __getstate__(self):
+        # Drained metrics are sent back from worker processes
+        return {"counters": self.counters, "timers": self.timers}
+
+    def __setstate__(self, state):
+        self.counters = state["counters"]
+        self.timers = state["timers"]
+        self._lock = threading.Lock()
+
+METRICS = Metrics()
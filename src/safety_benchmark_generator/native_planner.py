@@ -0,0 +1,310 @@
+import heapq
+import time
+from collections import deque
+from itertools import count
+from typing import Dict, List, Optional, Tuple
+
+from .pddl import parse_problem
+from .trace_evaluator import get_constraint_compiler
+
+# Positions of an item that is not lying in a location
+LEFT, RIGHT, BOTH = -1, -2, -3
+HAND_POSITIONS = {"left": LEFT, "right": RIGHT, "both": BOTH}
+HOLDING_PREDICATES = {"holding-left": LEFT, "holding-right": RIGHT, "holding-both": BOTH}
+
+# A state is (robot location, position of every item, bitmask of plugged-in electrical items)
+State = Tuple[int, Tuple[int, ...], int]
+
+class UnsupportedProblem(Exception):
+    pass
+
+class _StateView:
+    """Exposes a single search state through the interface of a StateTrace of length 1."""
+
+    length = 1
+    mask = 1
+
+    def __init__(self, task: "ManipulationTask", state: State):
+        self.task = task
+        self.state = state
+
+    def fact(self, atom: Tuple[str, ...]) -> int:
+        task = self.task
+        robot, positions, plugged = self.state
+        name = atom[0]
+        if name == "robot-at":
+            return int(robot == task.location_index.get(atom[1]))
+        elif name == "at":
+            i = task.item_index.get(atom[1])
+            return int(i is not None and positions[i] == task.location_index.get(atom[2]))
+        elif name in HOLDING_PREDICATES:
+            i = task.item_index.get(atom[1])
+            return int(i is not None and positions[i] == HOLDING_PREDICATES[name])
+        elif name == "plugged-in":
+            bit = task.electrical_bit.get(atom[1], 0)
+            return int(plugged & bit != 0)
+        elif name == "left-hand-empty":
+            return int(LEFT not in positions and BOTH not in positions)
+        elif name == "right-hand-empty":
+            return int(RIGHT not in positions and BOTH not in positions)
+        elif name == "connected":
+            return int(atom in task.connections)
+        return 0
+
+    def objects_of_type(self, obj_type: str) -> List[str]:
+        return self.task.objects_by_type.get(obj_type, [])
+
+class ManipulationTask:
+    """A problem of the manipulation domain, compiled for search."""
+
+    def __init__(self, pddl_problem: str, with_constraints: bool = True):
+        problem = parse_problem(pddl_problem)
+        self.locations = [o for o, t in problem.objects.items() if t == "location"]
+        self.items = [o for o, t in problem.objects.items() if t in ("item", "electrical-item")]
+        self.location_index = {l: i for i, l in enumerate(self.locations)}
+        self.item_index = {o: i for i, o in enumerate(self.items)}
+        self.electrical_bit = {o: 1 << i for i, o in enumerate(self.items) if problem.objects[o] == "electrical-item"}
+        self.objects_by_type = {
+            "location": self.locations,
+            "item": self.items,
+            "electrical-item": [o for o in self.items if o in self.electrical_bit],
+        }
+        self.objects_by_type["object"] = self.locations + self.items
+
+        self.connections = set()
+        self.neighbours = [[] for _ in self.locations]
+        robot, positions, plugged = None, [None] * len(self.items), 0
+        for atom in problem.init:
+            if atom[0] == "connected":
+                self.connections.add(atom)
+                a, b = self.location_index[atom[1]], self.location_index[atom[2]]
+                if b not in self.neighbours[a]:
+                    self.neighbours[a].append(b)
+                if a not in self.neighbours[b]:
+                    self.neighbours[b].append(a)
+            elif atom[0] == "robot-at":
+                robot = self.location_index[atom[1]]
+            elif atom[0] == "at":
+                positions[self.item_index[atom[1]]] = self.location_index[atom[2]]
+            elif atom[0] in HOLDING_PREDICATES:
+                positions[self.item_index[atom[1]]] = HOLDING_PREDICATES[atom[0]]
+            elif atom[0] == "plugged-in":
+                plugged |= self.electrical_bit[atom[1]]
+        if robot is None or None in positions:
+            raise UnsupportedProblem("The initial state does not place the robot and every item.")
+        self.initial_state: State = (robot, tuple(positions), plugged)
+
+        self.goal_positions: Dict[int, int] = {}
+        self.goal_plugged, self.goal_unplugged = 0, 0
+        self.goal_robot = None
+        for goal in problem.goals:
+            negated = goal[0] == "not"
+            atom = goal[1] if negated else goal
+            if negated and atom[0] != "plugged-in":
+                raise UnsupportedProblem(f"Unsupported negative goal {goal}.")
+            if atom[0] == "at":
+                self.goal_positions[self.item_index[atom[1]]] = self.location_index[atom[2]]
+            elif atom[0] in HOLDING_PREDICATES:
+                self.goal_positions[self.item_index[atom[1]]] = HOLDING_PREDICATES[atom[0]]
+            elif atom[0] == "plugged-in":
+                if negated:
+                    self.goal_unplugged |= self.electrical_bit[atom[1]]
+                else:
+                    self.goal_plugged |= self.electrical_bit[atom[1]]
+            elif atom[0] == "robot-at":
+                self.goal_robot = self.location_index[atom[1]]
+            else:
+                raise UnsupportedProblem(f"Unsupported goal {goal}.")
+
+        self.constraints = []
+        if with_constraints:
+            compiler = get_constraint_compiler()
+            for constraint in problem.constraints:
+                if constraint[0] in ("sometime", "at-end", "at-most-once", "sometime-before", "sometime-after", "within"):
+                    raise UnsupportedProblem(f"Only state constraints are supported, not '{constraint[0]}'.")
+                compiled = compiler.compile_expr(constraint)
+                if compiled is None:
+                    raise UnsupportedProblem(f"Cannot compile constraint {constraint}.")
+                self.constraints.append(compiled)
+
+        self.distances = self._all_pairs_shortest_paths()
+
+    def _all_pairs_shortest_paths(self) -> List[List[Optional[int]]]:
+        distances = []
+        for source in range(len(self.locations)):
+            dist = [None] * len(self.locations)
+            dist[source] = 0
+            queue = deque([source])
+            while queue:
+                loc = queue.popleft()
+                for neighbour in self.neighbours[loc]:
+                    if dist[neighbour] is None:
+                        dist[neighbour] = dist[loc] + 1
+                        queue.append(neighbour)
+            distances.append(dist)
+        return distances
+
+    def satisfies_constraints(self, state: State) -> bool:
+        if not self.constraints:
+            return True
+        view = _StateView(self, state)
+        return all(check(view, env) for check, env in self.constraints)
+
+    def is_goal(self, state: State) -> bool:
+        robot, positions, plugged = state
+        if self.goal_robot is not None and robot != self.goal_robot:
+            return False
+        if plugged & self.goal_plugged != self.goal_plugged or plugged & self.goal_unplugged:
+            return False
+        return all(positions[i] == p for i, p in self.goal_positions.items())
+
+    def heuristic(self, state: State) -> Optional[int]:
+        """Admissible estimate of the number of actions to a goal, None if provably unreachable.
+
+        Pick, place, plug-in and unplug actions each serve a single item, so the
+        ones every item still needs are summed up. Travel is bounded by the
+        longest detour the robot must make through some location where an item
+        must be picked, placed or (un)plugged, and then on to its own goal.
+        """
+        robot, positions, plugged = state
+        dist = self.distances
+        goal_robot = self.goal_robot
+        actions = 0
+        travel = 0 if goal_robot is None else dist[robot][goal_robot]
+        if travel is None:
+            return None
+
+        def visit(*locations):
+            total, current = 0, robot
+            for loc in locations + ((goal_robot,) if goal_robot is not None else ()):
+                d = dist[current][loc]
+                if d is None:
+                    return None
+                total, current = total + d, loc
+            return total
+
+        for i, goal in self.goal_positions.items():
+            pos = positions[i]
+            if pos == goal:
+                continue
+            if goal >= 0:
+                if pos >= 0:
+                    actions += 2
+                    detour = visit(pos, goal)
+                else:
+                    actions += 1
+                    detour = visit(goal)
+            elif pos >= 0:
+                actions += 1
+                detour = visit(pos)
+            else:
+                # Held with the wrong hands: place it and pick it up again
+                actions += 2
+                detour = 0
+            if detour is None:
+                return None
+            travel = max(travel, detour)
+
+        for item, bit in self.electrical_bit.items():
+            i = self.item_index[item]
+            pos = positions[i]
+            if self.goal_plugged & bit and not plugged & bit:
+                actions += 1
+                detour = visit(pos) if pos >= 0 else 0
+            elif self.goal_unplugged & bit and plugged & bit:
+                if pos < 0 or self.goal_positions.get(i, pos) != pos:
+                    # Moving while holding the item unplugs it
+                    continue
+                actions += 1
+                detour = visit(pos)
+            else:
+                continue
+            if detour is None:
+                return None
+            travel = max(travel, detour)
+
+        return actions + travel
+
+    def successors(self, state: State):
+        robot, positions, plugged = state
+        names = self.items
+        location = self.locations[robot]
+
+        held_mask = 0
+        left_free = right_free = True
+        for i, pos in enumerate(positions):
+            if pos < 0:
+                held_mask |= self.electrical_bit.get(names[i], 0)
+                if pos != RIGHT:
+                    left_free = False
+                if pos != LEFT:
+                    right_free = False
+
+        for neighbour in self.neighbours[robot]:
+            yield f"(go-to {location} {self.locations[neighbour]})", (neighbour, positions, plugged & ~held_mask)
+
+        for i, pos in enumerate(positions):
+            if pos == robot:
+                for hand, held_pos in HAND_POSITIONS.items():
+                    if (hand == "left" and left_free) or (hand == "right" and right_free) or (hand == "both" and left_free and right_free):
+                        new_positions = positions[:i] + (held_pos,) + positions[i + 1:]
+                        yield f"(pick-{hand} {names[i]} {location})", (robot, new_positions, plugged)
+                bit = self.electrical_bit.get(names[i])
+                if bit is not None and (left_free or right_free):
+                    if plugged & bit:
+                        yield f"(unplug {names[i]} {location})", (robot, positions, plugged & ~bit)
+                    else:
+                        yield f"(plug-in {names[i]} {location})", (robot, positions, plugged | bit)
+            elif pos < 0:
+                hand = {LEFT: "left", RIGHT: "right", BOTH: "both"}[pos]
+                new_positions = positions[:i] + (robot,) + positions[i + 1:]
+                yield f"(place-{hand} {names[i]} {location})", (robot, new_positions, plugged)
+
+def astar(task: ManipulationTask, weight: float = 1.0, bound: Optional[int] = None, timeout: Optional[float] = None) -> Optional[List[str]]:
+    """(Weighted) A* search over a manipulation task.
+
+    With `weight` 1 the returned plan is optimal. Only plans whose cost is
+    strictly lower than `bound` are considered, as in Fast Downward. Returns
+    None when there is no such plan or the timeout expires.
+    """
+    start = task.initial_state
+    if not task.satisfies_constraints(start):
+        return None
+    h = task.heuristic(start)
+    if h is None or (bound is not None and h >= bound):
+        return None
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    tie = count()
+    parents = {start: None}
+    best_g = {start: 0}
+    queue = [(weight * h, h, next(tie), 0, start)]
+    expansions = 0
+    while queue:
+        _, _, _, g, state = heapq.heappop(queue)
+        if g > best_g[state]:
+            continue
+        if task.is_goal(state):
+            plan = []
+            while parents[state] is not None:
+                state, action = parents[state]
+                plan.append(action)
+            return plan[::-1]
+
+        expansions += 1
+        if deadline is not None and expansions % 1000 == 0 and time.monotonic() > deadline:
+            return None
+
+        for action, successor in task.successors(state):
+            new_g = g + 1
+            if new_g >= best_g.get(successor, new_g + 1):
+                continue
+            h = task.heuristic(successor)
+            if h is None or (bound is not None and new_g + h >= bound):
+                continue
+            if not task.satisfies_constraints(successor):
+                continue
+            best_g[successor] = new_g
+            parents[successor] = (state, action)
+            heapq.heappush(queue, (new_g + weight * h, h, next(tie), new_g, successor))
+    return None
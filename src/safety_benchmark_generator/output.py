@@ -0,0 +1,164 @@
+import bisect
+import json
+import os
+import struct
+from typing import Dict, Iterable, List, Optional
+
+from .utils import write_atomic
+
+class ProblemWriter:
+    """Stores generated problems. Records may arrive in any order.
+
+    `write` returns the indices of the problems that are now on disk, which
+    may include earlier problems that were buffered.
+    """
+
+    def write(self, index: int, record: dict) -> List[int]:
+        raise NotImplementedError
+
+    def to_generate(self, pending: Iterable[int]) -> List[int]:
+        """The problems to generate so that all `pending` ones get written."""
+        return sorted(pending)
+
+    def truncate(self, last: int) -> List[int]:
+        """Make `last` the last problem, e.g. when generation stopped early, and
+        return the indices of the problems that are now on disk because of it."""
+        return []
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Complete shards are already on disk; do not hide the original error
+        if exc_type is None:
+            self.close()
+
+class FilesWriter(ProblemWriter):
+    """Four files per problem: `{index}.pddl`, `.init.nl`, `.goal.nl` and `.constraints.nl`."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, index, record):
+        path = os.path.join(self.directory, str(index))
+        write_atomic(f"{path}.pddl", record["pddl"])
+        write_atomic(f"{path}.init.nl", record["init"])
+        write_atomic(f"{path}.goal.nl", record["goal"])
+        write_atomic(f"{path}.constraints.nl", record["constraints"])
+        return [index]
+
+# Every entry of a shard index is the byte offset of a record, as a little-endian uint64
+INDEX_ENTRY = struct.Struct("<Q")
+
+class JsonlShardWriter(ProblemWriter):
+    """Problems `first` to `last` as JSON lines, `shard_size` per shard.
+
+    Shard `problems-{start}.jsonl` holds problems `start` to
+    `start + shard_size - 1` in order, and its sidecar `problems-{start}.idx`
+    holds the byte offset of each of its records. A shard is buffered in memory
+    until all of its problems arrived and is then written at once, atomically,
+    so every shard on disk is complete.
+    """
+
+    def __init__(self, directory: str, first: int, last: int, shard_size: int = 1000):
+        if shard_size < 1:
+            raise ValueError("The shard size must be at least 1.")
+        self.directory = directory
+        self.first = first
+        self.last = last
+        self.shard_size = shard_size
+        self._pending: Dict[int, Dict[int, dict]] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def shard_start(self, index: int) -> int:
+        return index - (index - self.first) % self.shard_size
+
+    def shard_range(self, start: int) -> range:
+        return range(start, min(start + self.shard_size, self.last + 1))
+
+    def to_generate(self, pending):
+        # Shards are written whole, so all problems of a shard are needed again
+        return sorted({i for p in pending for i in self.shard_range(self.shard_start(p))})
+
+    def write(self, index, record):
+        if not self.first <= index <= self.last:
+            raise ValueError(f"Problem {index} is outside of the range {self.first}-{self.last}.")
+        start = self.shard_start(index)
+        shard = self._pending.setdefault(start, {})
+        shard[index] = record
+        if len(shard) < len(self.shard_range(start)):
+            return []
+        del self._pending[start]
+        self._write_shard(start, [shard[i] for i in self.shard_range(start)])
+        return list(self.shard_range(start))
+
+    def truncate(self, last):
+        self.last = last
+        written = []
+        # The shard ending with `last` may now be complete
+        for start, shard in sorted(self._pending.items()):
+            if len(shard) == len(self.shard_range(start)):
+                del self._pending[start]
+                self._write_shard(start, [shard[i] for i in self.shard_range(start)])
+                written += self.shard_range(start)
+        return written
+
+    def _write_shard(self, start: int, records: List[dict]):
+        lines, offsets, offset = [], [], 0
+        for record in records:
+            line = (json.dumps(record, ensure_ascii=False) + "\n").encode()
+            offsets.append(INDEX_ENTRY.pack(offset))
+            lines.append(line)
+            offset += len(line)
+        base = os.path.join(self.directory, f"problems-{start:08d}")
+        # The index is written last: a shard only counts once its index exists
+        write_atomic(f"{base}.jsonl", b"".join(lines))
+        write_atomic(f"{base}.idx", b"".join(offsets))
+
+    def close(self):
+        if self._pending:
+            missing = sum(len(self.shard_range(s)) - len(r) for s, r in self._pending.items())
+            raise ValueError(f"{missing} problems were never written, {len(self._pending)} shards are incomplete.")
+
+class JsonlShardReader:
+    """Random access to the problems written by a JsonlShardWriter."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.starts, self.counts = [], []
+        for name in sorted(os.listdir(directory)):
+            if name.startswith("problems-") and name.endswith(".idx"):
+                self.starts.append(int(name[len("problems-"):-len(".idx")]))
+                self.counts.append(os.path.getsize(os.path.join(directory, name)) // INDEX_ENTRY.size)
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def indices(self) -> List[int]:
+        return [i for start, count in zip(self.starts, self.counts) for i in range(start, start + count)]
+
+    def get(self, index: int) -> Optional[dict]:
+        """Return problem `index`, or None if no shard holds it."""
+        k = bisect.bisect_right(self.starts, index) - 1
+        if k < 0 or index >= self.starts[k] + self.counts[k]:
+            return None
+        base = os.path.join(self.directory, f"problems-{self.starts[k]:08d}")
+        with open(f"{base}.idx", "rb") as f:
+            f.seek((index - self.starts[k]) * INDEX_ENTRY.size)
+            offset, = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))
+        with open(f"{base}.jsonl", "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+OUTPUT_FORMATS = ["files", "jsonl"]
+
+def make_problem_writer(output_format: str, directory: str, first: int, last: int, shard_size: int = 1000) -> ProblemWriter:
+    if output_format == "files":
+        return FilesWriter(directory)
+    elif output_format == "jsonl":
+        return JsonlShardWriter(directory, first, last, shard_size)
+    raise ValueError(f"Unknown output format '{output_format}'.")
@@ -0,0 +1,87 @@
+import re
+from typing import Dict, List, Tuple, Union
+
+SExpr = Union[str, List["SExpr"]]
+
+_TOKEN_RE = re.compile(r"[()]|[^\s()]+")
+
+def parse_sexpr(text: str) -> SExpr:
+    """Parse a single s-expression, lowercasing symbols and dropping `;` comments."""
+    text = re.sub(r";[^\n]*", "", text).lower()
+    stack: List[list] = [[]]
+    for token in _TOKEN_RE.findall(text):
+        if token == "(":
+            stack.append([])
+        elif token == ")":
+            if len(stack) == 1:
+                raise ValueError("Unbalanced parentheses in PDDL text.")
+            expr = stack.pop()
+            stack[-1].append(expr)
+        else:
+            stack[-1].append(token)
+    if len(stack) != 1:
+        raise ValueError("Unbalanced parentheses in PDDL text.")
+    if len(stack[0]) != 1:
+        raise ValueError(f"Expected one s-expression, found {len(stack[0])}.")
+    return stack[0][0]
+
+def parse_typed_list(tokens: List[str]) -> Dict[str, str]:
+    """Parse `a b - type c - type2` into {a: type, b: type, c: type2}."""
+    res = {}
+    pending = []
+    i = 0
+    while i < len(tokens):
+        if tokens[i] == "-":
+            for name in pending:
+                res[name] = tokens[i + 1]
+            pending = []
+            i += 2
+        else:
+            pending.append(tokens[i])
+            i += 1
+    for name in pending:
+        res[name] = "object"
+    return res
+
+def _conjuncts(formula: SExpr) -> List[SExpr]:
+    if isinstance(formula, list) and formula and formula[0] == "and":
+        return formula[1:]
+    return [formula]
+
+class ParsedProblem:
+    def __init__(self, objects: Dict[str, str], init: List[Tuple[str, ...]], goals: List[SExpr], constraints: List[SExpr]):
+        self.objects = objects
+        self.init = init
+        self.goals = goals
+        self.constraints = constraints
+
+def parse_problem(text: str) -> ParsedProblem:
+    expr = parse_sexpr(text)
+    if not isinstance(expr, list) or not expr or expr[0] != "define":
+        raise ValueError("Not a PDDL problem definition.")
+
+    objects, init, goals, constraints = {}, [], [], []
+    for section in expr[1:]:
+        if not isinstance(section, list) or not section:
+            continue
+        if section[0] == ":objects":
+            objects = parse_typed_list(section[1:])
+        elif section[0] == ":init":
+            init = [tuple(atom) for atom in section[1:]]
+        elif section[0] == ":goal":
+            goals = _conjuncts(section[1])
+        elif section[0] == ":constraints":
+            constraints = _conjuncts(section[1])
+    return ParsedProblem(objects, init, goals, constraints)
+
+def parse_plan(plan: str) -> List[Tuple[str, ...]]:
+    """Parse a plan with one `(action arg ...)` per line, ignoring comments such as `; cost = ...`."""
+    actions = []
+    for line in plan.splitlines():
+        line = line.split(";", 1)[0].strip().lower()
+        if not line:
+            continue
+        if not (line.startswith("(") and line.endswith(")")):
+            raise ValueError(f"Cannot parse plan step '{line}'.")
+        actions.append(tuple(line[1:-1].split()))
+    return actions
@@ -0,0 +1,285 @@
+import asyncio
+import json
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+from .metrics import METRICS
+from .planner_backends import PlannerFailure
+from .problem_generator import RandomProblemGenerator, UsefulnessChecker
+from .utils import derive_seed
+
+handle = "safety-benchmark-generator"
+logger = logging.getLogger(handle)
+
+class AsyncPlanner:
+    """Runs planner requests in subprocesses speaking the planner_cli protocol.
+
+    At most `max_concurrency` subprocesses run at any time, however many
+    stages and instances are waiting for plans. A subprocess that cannot be
+    started, crashes, hangs or answers garbage raises PlannerFailure.
+    """
+
+    # Extra seconds granted to the subprocess beyond the planner timeout
+    GRACE = 5
+
+    def __init__(self, command: Sequence[str], max_concurrency: int):
+        self.command = list(command)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def solve(self, domain_pddl: str, problem_pddl: str, optimality: bool = False,
+                    heuristic: Optional[str] = None, bound: Optional[int] = None, timeout: float = 60) -> Optional[str]:
+        request = json.dumps({
+            "domain": domain_pddl, "problem": problem_pddl, "optimality": optimality,
+            "heuristic": heuristic, "bound": bound, "timeout": timeout,
+        }).encode()
+        async with self.semaphore:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *self.command, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE
+                )
+            except OSError as e:
+                raise PlannerFailure(f"Cannot start the planner subprocess: {e}.") from None
+            try:
+                stdout, _ = await asyncio.wait_for(process.communicate(request), timeout + self.GRACE)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise PlannerFailure(f"Planner subprocess did not answer within {timeout + self.GRACE}s.") from None
+            except asyncio.CancelledError:
+                process.kill()
+                await process.wait()
+                raise
+        if process.returncode != 0:
+            raise PlannerFailure(f"Planner subprocess exited with code {process.returncode}.")
+        try:
+            return json.loads(stdout)["plan"]
+        except (ValueError, KeyError):
+            raise PlannerFailure("Planner subprocess gave a malformed answer.") from None
+
+class _Problem:
+    """Candidates of one problem in flight. Like SpeculativeSampler, the accepted
+    candidate is the lowest-numbered useful one, so the result only depends on the seed."""
+
+    def __init__(self, index: int, seed: int):
+        self.index = index
+        self.seed = seed
+        self.next_candidate = 0
+        self.in_flight = set()
+        self.best = None  # (candidate number, record parts)
+        self.emitted = False
+
+    def cancelled(self, n: int) -> bool:
+        return self.best is not None and n > self.best[0]
+
+    @property
+    def complete(self) -> bool:
+        return self.best is not None and all(n > self.best[0] for n in self.in_flight)
+
+# What GenerationPipeline._solve returns when the planner failed
+_FAILED = object()
+
+class _Candidate:
+    def __init__(self, problem: _Problem, n: int, instance):
+        self.problem = problem
+        self.n = n
+        self.instance = instance
+        self.checker = None
+        self.plan = None
+        self.useful = None
+
+class GenerationPipeline:
+    """Finds useful problems with asyncio, overlapping planner runs across candidates and problems.
+
+    Candidates flow through bounded queues between the stages sample ->
+    optimal plan without constraints -> constraint evaluation -> solvability
+    check. The planner stages await subprocesses of `planner`, so that
+    candidates of several problems are being planned for at the same time.
+    Sampling, pre-filtering and constraint evaluation are CPU-bound: they run
+    one at a time on a worker thread, so that the event loop keeps starting
+    planner subprocesses and reading their answers meanwhile.
+    """
+
+    def __init__(self, num_locations, num_items, num_goals, num_constraints, planner_timeout,
+                 planner: AsyncPlanner, prefilter=None, dedup=None, topology="tree", target_bias: float = 0.0,
+                 queue_size: int = 8, max_active: int = 4):
+        self.num_locations = num_locations
+        self.num_items = num_items
+        self.num_goals = num_goals
+        self.num_constraints = num_constraints
+        self.planner_timeout = planner_timeout
+        self.planner = planner
+        self.prefilter = prefilter
+        self.dedup = dedup
+        self.topology = topology
+        self.target_bias = target_bias
+        self.queue_size = queue_size
+        self.max_active = max_active
+
+    def run(self, seeds: Dict[int, int], on_problem: Callable):
+        """Generate a useful problem for every index of `seeds`, calling
+        `on_problem(index, pddl, init, goal, constraints, num_constraints)` as each is found."""
+        asyncio.run(self._run(seeds, on_problem))
+
+    async def _run(self, seeds, on_problem):
+        self._on_problem = on_problem
+        self._progress = asyncio.Event()
+        self._plan_queue = asyncio.Queue(self.queue_size)
+        self._evaluate_queue = asyncio.Queue(self.queue_size)
+        self._solve_queue = asyncio.Queue(self.queue_size)
+        workers = self.queue_size
+        tasks = [asyncio.create_task(self._plan_stage()) for _ in range(workers)]
+        tasks += [asyncio.create_task(self._evaluate_stage())]
+        tasks += [asyncio.create_task(self._solve_stage()) for _ in range(workers)]
+        sampling = asyncio.create_task(self._sample_stage([_Problem(i, seed) for i, seed in sorted(seeds.items())]))
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            done, _ = await asyncio.wait([sampling] + tasks, return_when=asyncio.FIRST_COMPLETED)
+            # The other stages never return, they only finish by failing, which stops the run
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks + [sampling]:
+                task.cancel()
+            await asyncio.gather(*tasks, sampling, return_exceptions=True)
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    async def _compute(self, function, *args):
+        """Run `function(*args)` on the worker thread."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def _sample_stage(self, pending: List[_Problem]):
+        pending.reverse()
+        active: List[_Problem] = []
+        while pending or active:
+            while pending and len(active) < self.max_active:
+                active.append(pending.pop())
+            sampled = False
+            for problem in list(active):
+                if problem.complete:
+                    active.remove(problem)
+                    continue
+                if problem.best is not None:
+                    continue
+                n = problem.next_candidate
+                problem.next_candidate += 1
+                problem.in_flight.add(n)
+                await self._sample(problem, n)
+                sampled = True
+            if not sampled and active:
+                # Every active problem waits for candidates in flight
+                self._progress.clear()
+                await self._progress.wait()
+
+    async def _sample(self, problem: _Problem, n: int):
+        rng = random.Random(derive_seed(problem.seed, "candidate", n))
+        METRICS.count("candidates")
+        generator = RandomProblemGenerator(self.num_locations, self.num_items, self.num_goals,
+                                           self.num_constraints, self.topology, rng, target_bias=self.target_bias)
+        with METRICS.timer("stage", stage="instance_generation"):
+            instance = await self._compute(generator.generate_random_instance)
+        if self.prefilter is not None:
+            with METRICS.timer("stage", stage="prefilter"):
+                # --salvage is not supported by the pipeline
+                reason = await self._compute(self.prefilter.check, instance, self.num_constraints == -1)
+            if reason is not None:
+                METRICS.count("candidates_rejected", reason=f"prefilter: {reason}")
+                self._finish(_Candidate(problem, n, instance), accepted=False)
+                return
+        if self.dedup is not None:
+            with METRICS.timer("stage", stage="dedup"):
+                unique = self.dedup.add(instance, problem.seed, constraints=False)
+            if not unique:
+                METRICS.count("candidates_rejected", reason="duplicate")
+                self._finish(_Candidate(problem, n, instance), accepted=False)
+                return
+        await self._plan_queue.put(_Candidate(problem, n, instance))
+
+    async def _plan_stage(self):
+        while True:
+            candidate = await self._plan_queue.get()
+            if candidate.problem.cancelled(candidate.n):
+                self._finish(candidate, accepted=False)
+                continue
+            checker = UsefulnessChecker(candidate.instance, self.planner_timeout, compute_plan=False)
+            with METRICS.timer("stage", stage="optimal_plan"):
+                plan = await self._solve(
+                    checker.pddl_domain,
+                    candidate.instance.show_pddl(show_constraints=False),
+                    optimality=True,
+                    heuristic="hmax()",
+                    timeout=self.planner_timeout,
+                )
+            if plan is _FAILED:
+                self._finish(candidate, accepted=False)
+                continue
+            if plan is None:
+                METRICS.count("candidates_rejected", reason="no plan")
+                self._finish(candidate, accepted=False)
+                continue
+            candidate.checker = checker
+            candidate.plan = plan
+            await self._evaluate_queue.put(candidate)
+
+    async def _evaluate_stage(self):
+        while True:
+            candidate = await self._evaluate_queue.get()
+            if candidate.problem.cancelled(candidate.n):
+                self._finish(candidate, accepted=False)
+                continue
+            with METRICS.timer("stage", stage="constraint_checks"):
+                candidate.useful = await self._compute(self._useful_constraints, candidate)
+            if not candidate.useful:
+                METRICS.count("candidates_rejected", reason="no useful constraints")
+                self._finish(candidate, accepted=False)
+                continue
+            await self._solve_queue.put(candidate)
+
+    async def _solve_stage(self):
+        while True:
+            candidate = await self._solve_queue.get()
+            if candidate.problem.cancelled(candidate.n):
+                self._finish(candidate, accepted=False)
+                continue
+            checker = candidate.checker
+            problem_pddl = await self._compute(checker.constrained_problem_pddl, candidate.useful)
+            with METRICS.timer("stage", stage="solvability"):
+                plan = await self._solve(checker.pddl_domain, problem_pddl, timeout=self.planner_timeout)
+            if plan is _FAILED:
+                self._finish(candidate, accepted=False)
+                continue
+            if plan is None:
+                METRICS.count("candidates_rejected", reason="unsolvable with constraints")
+            else:
+                METRICS.count("candidates_accepted")
+            self._finish(candidate, accepted=plan is not None)
+
+    def _useful_constraints(self, candidate: _Candidate):
+        # On the worker thread: simulating the plan is part of the evaluation
+        candidate.checker.set_plan(candidate.plan)
+        return candidate.checker.get_useful_constraints(limit=None if self.num_constraints == -1 else self.num_constraints)
+
+    async def _solve(self, domain_pddl, problem_pddl, **options):
+        # A planner failure is no verdict on the problem, the candidate is dropped instead
+        try:
+            return await self.planner.solve(domain_pddl, problem_pddl, **options)
+        except PlannerFailure as e:
+            logger.warning(f"{e} Dropping the candidate.")
+            METRICS.count("planner_failures")
+            METRICS.count("candidates_rejected", reason="planner failure")
+            return _FAILED
+
+    def _finish(self, candidate: _Candidate, accepted: bool):
+        problem = candidate.problem
+        problem.in_flight.discard(candidate.n)
+        if accepted and (problem.best is None or candidate.n < problem.best[0]):
+            instance = candidate.instance
+            instance.constraints = candidate.useful
+            init_desc, goal_desc, constr_desc = instance.show_nl()
+            problem.best = (candidate.n, (instance.show_pddl(), init_desc, goal_desc, constr_desc, len(candidate.useful)))
+            logger.info(f"Problem {problem.index}: candidate {candidate.n} is useful.")
+        if problem.complete and not problem.emitted:
+            problem.emitted = True
+            self._on_problem(problem.index, *problem.best[1])
+        self._progress.set()
@@ -0,0 +1,115 @@
+import logging
+from typing import Dict, Optional
+
+from .native_planner import ManipulationTask, UnsupportedProblem, astar
+
+handle = "safety-benchmark-generator"
+logger = logging.getLogger(handle)
+
+class PlannerFailure(Exception):
+    """The planner could not give an answer (e.g. its process crashed or hung).
+
+    Unlike a None plan, this says nothing about the problem, so it must not
+    be taken, or cached, as a verdict on it.
+    """
+
+class PlannerBackend:
+    """Computes plans for a PDDL domain and problem.
+
+    `solve` returns the plan as one `(action arg ...)` per line, or None when
+    no plan was found within `timeout` seconds. With `optimality` the plan
+    must be optimal; `bound` only admits plans whose cost is lower than it.
+    Backends that run the planner out of process raise PlannerFailure when
+    it fails to answer.
+    """
+
+    name = None
+
+    def solve(self, domain_pddl: str, problem_pddl: str, optimality: bool = False,
+              heuristic: Optional[str] = None, bound: Optional[int] = None, timeout: int = 60) -> Optional[str]:
+        raise NotImplementedError
+
+class FastDownwardBackend(PlannerBackend):
+    name = "fast-downward"
+
+    def solve(self, domain_pddl, problem_pddl, optimality=False, heuristic=None, bound=None, timeout=60):
+        options = {}
+        if heuristic is not None:
+            options["heuristic"] = heuristic
+        if bound is not None:
+            options["bound"] = bound
+        # Imported on first use, runs that never call Fast Downward do not pay for it
+        from llm_planners import planners
+        return planners.run_fast_downward_planner(
+            domain_pddl,
+            problem_pddl,
+            optimality=optimality,
+            timeout=timeout,
+            **options
+        )
+
+class NativeBackend(PlannerBackend):
+    """In-process A* search specialised for the manipulation domain.
+
+    Its heuristic is admissible, so optimal plans are found with plain A*;
+    satisficing plans use weighted A*. State constraints (bare formulas and
+    `always`) are enforced on every state of the search. Problems it does not
+    support are handed to `fallback`, if any. The `heuristic` option only
+    makes sense for Fast Downward and is ignored.
+    """
+
+    name = "native"
+
+    def __init__(self, fallback: Optional[PlannerBackend] = None, satisficing_weight: float = 5.0):
+        self.fallback = fallback
+        self.satisficing_weight = satisficing_weight
+
+    def solve(self, domain_pddl, problem_pddl, optimality=False, heuristic=None, bound=None, timeout=60):
+        try:
+            if "(domain manipulation)" not in " ".join(domain_pddl.lower().split()):
+                raise UnsupportedProblem("Only the manipulation domain is supported.")
+            task = ManipulationTask(problem_pddl)
+        except UnsupportedProblem as e:
+            if self.fallback is None:
+                raise
+            logger.info(f"Native planner cannot handle the problem ({e}), using {self.fallback.name}.")
+            return self.fallback.solve(domain_pddl, problem_pddl, optimality=optimality,
+                                       heuristic=heuristic, bound=bound, timeout=timeout)
+
+        weight = 1.0 if optimality else self.satisficing_weight
+        plan = astar(task, weight=weight, bound=bound, timeout=timeout)
+        if plan is None:
+            return None
+        return "\n".join(plan) + "\n"
+
+class StubBackend(PlannerBackend):
+    """Stands in for the planner `name` without planning.
+
+    It answers with the plan given for the problem in `plans` (None meaning
+    no plan) and raises PlannerFailure for any other problem, so that code
+    calling a planner runs offline. Wrapped in a CachedBackend, it replays
+    the answers that `name` recorded in a planner cache (see --offline).
+    """
+
+    def __init__(self, name: str, plans: Optional[Dict[str, Optional[str]]] = None):
+        self.name = name
+        self.plans = dict(plans or {})
+
+    def solve(self, domain_pddl, problem_pddl, optimality=False, heuristic=None, bound=None, timeout=60):
+        try:
+            return self.plans[problem_pddl]
+        except KeyError:
+            raise PlannerFailure(f"No recorded answer of {self.name} for the problem.") from None
+
+PLANNER_BACKENDS = {
+    FastDownwardBackend.name: FastDownwardBackend,
+    NativeBackend.name: NativeBackend,
+}
+
+def make_planner_backend(name: str) -> PlannerBackend:
+    if name == NativeBackend.name:
+        return NativeBackend(fallback=FastDownwardBackend())
+    try:
+        return PLANNER_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown planner backend '{name}'.") from None
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+from .metrics import METRICS
+from .planner_backends import PlannerBackend
+from .utils import write_atomic
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+handle = "safety-benchmark-generator"
+logger = logging.getLogger(handle)
+
+def normalize_pddl(text: str) -> str:
+    """Lowercase PDDL text and drop comments and insignificant whitespace."""
+    text = re.sub(r";[^\n]*", "", text).lower()
+    text = re.sub(r"\s+", " ", text)
+    return re.sub(r"\s*([()])\s*", r"\1", text).strip()
+
+class PlannerCache:
+    """Persistent planner results, content-addressed by domain, problem and planner options.
+
+    Every entry is a small JSON file, written atomically, so several processes
+    can share a cache directory. Failed searches are stored with their timeout
+    and only reused for requests with the same or a shorter timeout, since the
+    planner does not tell "unsolvable" apart from "timed out". When the cache
+    grows over `max_bytes`, the least recently used entries are evicted.
+    """
+
+    EVICTION_INTERVAL = 100
+
+    def __init__(self, directory: str, max_bytes: int = 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_eviction = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(domain_pddl: str, problem_pddl: str, options: dict) -> str:
+        h = hashlib.sha256()
+        for part in (normalize_pddl(domain_pddl), normalize_pddl(problem_pddl), json.dumps(options, sort_keys=True)):
+            h.update(part.encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str, timeout: float) -> Tuple[bool, Optional[str]]:
+        """Return whether the cache can answer the request, and the cached plan."""
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+            if entry["plan"] is None and timeout > entry["timeout"]:
+                self._miss()
+                return False, None
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError, KeyError):
+            self._miss()
+            return False, None
+        self.hits += 1
+        METRICS.count("planner_cache", result="hit")
+        return True, entry["plan"]
+
+    def _miss(self):
+        self.misses += 1
+        METRICS.count("planner_cache", result="miss")
+
+    def put(self, key: str, plan: Optional[str], timeout: float):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, json.dumps({"plan": plan, "timeout": timeout, "created": time.time()}))
+        self._puts_since_eviction += 1
+        if self._puts_since_eviction >= self.EVICTION_INTERVAL:
+            self._puts_since_eviction = 0
+            self.evict()
+
+    @contextmanager
+    def _lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def evict(self):
+        """Remove least recently used entries until the cache takes at most 90% of `max_bytes`."""
+        with self._lock():
+            entries, total = [], 0
+            for shard in os.scandir(self.directory):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.name.startswith(".") or not entry.name.endswith(".json"):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            target = 0.9 * self.max_bytes
+            removed = 0
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            logger.info(f"Evicted {removed} entries from the planner cache.")
+
+class CachedBackend(PlannerBackend):
+    """Answers planner requests from a PlannerCache, asking `backend` on a miss.
+
+    Only answers of the planner are cached: a PlannerFailure of `backend`
+    propagates and leaves the cache unchanged.
+    """
+
+    def __init__(self, backend: PlannerBackend, cache: PlannerCache):
+        self.backend = backend
+        self.cache = cache
+        self.name = backend.name
+
+    def solve(self, domain_pddl, problem_pddl, optimality=False, heuristic=None, bound=None, timeout=60):
+        options = {"planner": self.backend.name, "optimality": optimality, "heuristic": heuristic, "bound": bound}
+        key = self.cache.key(domain_pddl, problem_pddl, options)
+        hit, plan = self.cache.get(key, timeout)
+        if hit:
+            return plan
+        plan = self.backend.solve(domain_pddl, problem_pddl, optimality=optimality,
+                                  heuristic=heuristic, bound=bound, timeout=timeout)
+        self.cache.put(key, plan, timeout)
+        return plan
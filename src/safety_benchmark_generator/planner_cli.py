@@ -0,0 +1,70 @@
+"""Runs planner requests in a separate process.
+
+A request is a JSON object with the keys "domain", "problem", "optimality",
+"heuristic", "bound" and "timeout" (the arguments of PlannerBackend.solve),
+and its answer is {"plan": <plan or null>}. By default one request is read
+from stdin and answered on stdout. With --serve the process keeps answering
+requests, one JSON object per line, until stdin is closed, so that the
+worker pool can reuse it. Any executable speaking this protocol can stand in
+for the planner of the asyncio pipeline, e.g. to test it without Fast Downward.
+"""
+import argparse
+import json
+import sys
+from typing import List, Optional
+
+from .planner_backends import PLANNER_BACKENDS, StubBackend, make_planner_backend
+from .planner_cache import CachedBackend, PlannerCache
+
+def planner_command(backend: str, cache: Optional[str] = None, cache_size: Optional[int] = None,
+                    serve: bool = False, offline: bool = False) -> List[str]:
+    """The command running `backend` through planner_cli."""
+    command = [sys.executable, "-m", "safety_benchmark_generator.planner_cli", "--backend", backend]
+    if cache is not None:
+        command += ["--cache", cache]
+    if cache_size is not None:
+        command += ["--cache-size", str(cache_size)]
+    if offline:
+        command.append("--offline")
+    if serve:
+        command.append("--serve")
+    return command
+
+def answer(planner, request: dict) -> dict:
+    plan = planner.solve(
+        request["domain"],
+        request["problem"],
+        optimality=request.get("optimality", False),
+        heuristic=request.get("heuristic"),
+        bound=request.get("bound"),
+        timeout=request.get("timeout", 60),
+    )
+    return {"plan": plan}
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer JSON planner requests read from stdin.")
+    parser.add_argument("--backend", choices=sorted(PLANNER_BACKENDS), default="fast-downward", help="Planner backend.")
+    parser.add_argument("--cache", default=None, help="Directory of a planner cache to use.")
+    parser.add_argument("--cache-size", type=int, default=1024, help="Maximum size of the planner cache in MB.")
+    parser.add_argument("--serve", action="store_true", help="Answer one request per line until stdin is closed.")
+    parser.add_argument("--offline", action="store_true", help="Only replay the answers of --backend recorded in --cache, failing on the other requests.")
+    args = parser.parse_args()
+
+    if args.offline and args.cache is None:
+        parser.error("--offline replays a planner cache, it requires --cache.")
+    planner = StubBackend(args.backend) if args.offline else make_planner_backend(args.backend)
+    if args.cache is not None:
+        planner = CachedBackend(planner, PlannerCache(args.cache, max_bytes=args.cache_size * 1024 ** 2))
+
+    if not args.serve:
+        json.dump(answer(planner, json.load(sys.stdin)), sys.stdout)
+        return
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        sys.stdout.write(json.dumps(answer(planner, json.loads(line))) + "\n")
+        sys.stdout.flush()
+
+if __name__ == "__main__":
+    main()
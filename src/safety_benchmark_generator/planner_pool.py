@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+import queue
+import select
+import subprocess
+import threading
+import time
+from typing import Sequence
+
+from .metrics import METRICS
+from .planner_backends import PlannerBackend, PlannerFailure
+
+handle = "safety-benchmark-generator"
+logger = logging.getLogger(handle)
+
+class WorkerFailure(Exception):
+    pass
+
+class _Worker:
+    """A planner subprocess answering one JSON request per line (planner_cli --serve)."""
+
+    def __init__(self, command: Sequence[str]):
+        self.process = subprocess.Popen(list(command), stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+        self.buffer = b""
+
+    def request(self, request: dict, timeout: float) -> dict:
+        try:
+            self.process.stdin.write(json.dumps(request).encode() + b"\n")
+        except BrokenPipeError:
+            raise WorkerFailure(f"exited with code {self.process.wait()}") from None
+        deadline = time.monotonic() + timeout
+        stdout = self.process.stdout.fileno()
+        while b"\n" not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([stdout], [], [], remaining)[0]:
+                raise WorkerFailure(f"did not answer within {timeout}s")
+            chunk = os.read(stdout, 1 << 16)
+            if not chunk:
+                raise WorkerFailure(f"exited with code {self.process.wait()}")
+            self.buffer += chunk
+        line, _, self.buffer = self.buffer.partition(b"\n")
+        try:
+            return json.loads(line)
+        except ValueError:
+            raise WorkerFailure("gave a malformed answer") from None
+
+    def close(self):
+        self.process.kill()
+        self.process.wait()
+
+class WorkerPoolBackend(PlannerBackend):
+    """Sends planner requests to long-lived worker processes running `command`,
+    which speak the planner_cli --serve protocol.
+
+    Workers are started on first use, at most `workers` of them, and reused
+    across requests, so that imports, the domain and the caches of the
+    backend they run are only loaded once. Requests from several threads
+    (salvage) are spread over idle workers. A worker
+    that crashes, or does not answer within the request timeout plus `GRACE`
+    seconds, is killed and replaced, and the request raises PlannerFailure. Pickled
+    and forked copies, e.g. in worker processes, start their own workers.
+    The pool is named after the planner its workers run, `name`, so that
+    cached plans are shared with that planner run in-process.
+    """
+
+    # Extra seconds granted to a worker beyond the planner timeout
+    GRACE = 5
+
+    def __init__(self, command: Sequence[str], workers: int, name: str):
+        if workers < 1:
+            raise ValueError("A worker pool needs at least one worker.")
+        self.command = list(command)
+        self.workers = workers
+        self.name = name
+        self._start_pool()
+
+    def _start_pool(self):
+        self._idle = queue.LifoQueue()  # the most recently used worker first
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        # Forked processes must not talk to the workers of their parent
+        if self._pid != os.getpid():
+            self._start_pool()
+
+    def solve(self, domain_pddl, problem_pddl, optimality=False, heuristic=None, bound=None, timeout=60):
+        request = {
+            "domain": domain_pddl, "problem": problem_pddl, "optimality": optimality,
+            "heuristic": heuristic, "bound": bound, "timeout": timeout,
+        }
+        self._check_pid()
+        with self._slots:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                worker = _Worker(self.command)
+                METRICS.count("planner_workers_started")
+            try:
+                answer = worker.request(request, timeout + self.GRACE)
+            except WorkerFailure as e:
+                logger.warning(f"Planner worker {e}, replacing it.")
+                METRICS.count("planner_workers_recycled")
+                worker.close()
+                raise PlannerFailure(f"Planner worker {e}.") from None
+            self._idle.put(worker)
+        return answer.get("plan")
+
+    def close(self):
+        """Stop the idle workers; workers are started again if needed."""
+        self._check_pid()
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def __getstate__(self):
+        return {"command": self.command, "workers": self.workers, "name": self.name}
+
+    def __setstate__(self, state):
+        self.command = state["command"]
+        self.workers = state["workers"]
+        self.name = state["name"]
+        self._start_pool()
@@ -0,0 +1,95 @@
+from typing import Dict, List, Sequence, Tuple
+
+from .pddl import SExpr
+from .templates import Template, get_template_registry
+
+class SymbolTable:
+    """Interns object names as small integers."""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+
+    def intern(self, name: str) -> int:
+        try:
+            return self._ids[name]
+        except KeyError:
+            symbol = self._ids[name] = len(self._names)
+            self._names.append(name)
+            return symbol
+
+    def name(self, symbol: int) -> str:
+        return self._names[symbol]
+
+SYMBOLS = SymbolTable()
+
+def _unpickle_predicate(category: str, name: str, arg_names: Sequence[str]) -> "Predicate":
+    template = get_template_registry().get(category, name)
+    return Predicate(template.template_id, tuple(SYMBOLS.intern(a) for a in arg_names))
+
+class Predicate:
+    """A template instance, stored as a template ID and the symbol IDs of its placeholder values.
+
+    The PDDL and natural language text is only rendered when first asked for.
+    """
+
+    __slots__ = ("template_id", "args", "_text")
+
+    def __init__(self, template_id: int, args: Tuple[int, ...]):
+        self.template_id = template_id
+        self.args = args
+        self._text = None
+
+    @staticmethod
+    def from_template(template: Template, placeholders: Dict[str, str]) -> "Predicate":
+        intern = SYMBOLS.intern
+        return Predicate(template.template_id, tuple(intern(a) for a in template.ordered_args(placeholders)))
+
+    @property
+    def template(self) -> Template:
+        return get_template_registry().by_id(self.template_id)
+
+    @property
+    def arg_names(self) -> Tuple[str, ...]:
+        name = SYMBOLS.name
+        return tuple(name(a) for a in self.args)
+
+    @property
+    def params(self) -> Dict[str, str]:
+        return dict(zip(self.template.placeholders, self.arg_names))
+
+    def _render(self) -> Tuple[str, str]:
+        if self._text is None:
+            self._text = self.template.render_args(self.arg_names)
+        return self._text
+
+    @property
+    def pddl(self) -> str:
+        return self._render()[0]
+
+    @property
+    def nl(self) -> str:
+        return self._render()[1]
+
+    def expressions(self) -> List[SExpr]:
+        """The PDDL s-expressions of the predicate, e.g. the atoms of an initial state predicate."""
+        return self.template.expressions(self.arg_names)
+
+    def mentions(self, name: str) -> bool:
+        return SYMBOLS.intern(name) in self.args
+
+    def __eq__(self, other):
+        if not isinstance(other, Predicate):
+            return NotImplemented
+        return self.template_id == other.template_id and self.args == other.args
+
+    def __hash__(self):
+        return hash((self.template_id, self.args))
+
+    def __repr__(self):
+        return f"Predicate({self.template.name}, {', '.join(self.arg_names)})"
+
+    def __reduce__(self):
+        # Symbol IDs are only meaningful within a process
+        template = self.template
+        return _unpickle_predicate, (template.category, template.name, self.arg_names)
@@ -1,14 +1,28 @@
 import random
 import os
 import math
-from itertools import chain
+import time
+from itertools import chain, count, islice
 import logging
-from typing import List, Tuple
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
 
-from llm_planners import planners
 from . import domains
+from .catalog import CATALOG, ConceptCatalog, ConceptIndex
 from .manipulation_concepts import *
-from planning_eval_framework.plan_evaluator import PlanEvaluator
+from .templates import (
+    CONSTRAINT_TEMPLATES,
+    GOAL_PREDICATE_TEMPLATES,
+    INIT_PREDICATE_TEMPLATES,
+    get_template_registry,
+)
+from .location_graph import LocationGraph, generate_location_graph
+from .metrics import METRICS
+from .predicates import SYMBOLS, Predicate
+from .native_planner import ManipulationTask, UnsupportedProblem
+from .planner_backends import FastDownwardBackend, PlannerBackend, PlannerFailure
+from .salvage import maximal_solvable_subset
+from .scheduler import TimeBudget
+from .trace_evaluator import TraceEvaluator
 MANIPULATION_DOMAIN = domains.Manipulation()
 
 handle = "safety-benchmark-generator"
@@ -19,11 +33,14 @@ package_dir = os.path.dirname(__file__)
 class ProblemInstance:
     def __init__(self,
             locations,
-            initial_state,
-            goals,
-            constraints,
+            initial_state: Sequence[Predicate],
+            goals: Sequence[Predicate],
+            constraints: Sequence[Predicate],
             non_electrical_items_names,
-            electrical_items_names):
+            electrical_items_names,
+            location_graph: Optional[LocationGraph] = None):
+        self._rendered = {}
+        self.location_graph = location_graph
         self.locations = locations
         self.initial_state = initial_state
         self.goals = goals
@@ -31,186 +48,238 @@ class ProblemInstance:
         self.non_electrical_items_names = non_electrical_items_names
         self.electrical_items_names = electrical_items_names
 
+    # Rendered documents are memoized, so predicates are stored as tuples and
+    # replacing them drops what was rendered from the previous ones.
+    @property
+    def initial_state(self) -> Tuple[Predicate, ...]:
+        return self._initial_state
+
+    @initial_state.setter
+    def initial_state(self, predicates: Sequence[Predicate]):
+        self._initial_state = tuple(predicates)
+        self._rendered.clear()
+
+    @property
+    def goals(self) -> Tuple[Predicate, ...]:
+        return self._goals
+
+    @goals.setter
+    def goals(self, predicates: Sequence[Predicate]):
+        self._goals = tuple(predicates)
+        self._rendered.clear()
+
+    @property
+    def constraints(self) -> Tuple[Predicate, ...]:
+        return self._constraints
+
+    @constraints.setter
+    def constraints(self, predicates: Sequence[Predicate]):
+        self._constraints = tuple(predicates)
+        self._rendered.clear()
+
+    def objects(self) -> Dict[str, str]:
+        """Map every object of the problem to its PDDL type."""
+        objects = {loc.name: "location" for loc in self.locations}
+        objects.update((name, "item") for name in self.non_electrical_items_names)
+        objects.update((name, "electrical-item") for name in self.electrical_items_names)
+        return objects
+
+    def constrained_items(self) -> Set[str]:
+        """Names of the items mentioned by some constraint."""
+        items = {SYMBOLS.intern(name) for name in chain(self.non_electrical_items_names, self.electrical_items_names)}
+        return {SYMBOLS.name(arg) for c in self.constraints for arg in c.args if arg in items}
+
     def show_pddl(self, show_constraints=True):
         if not self.locations:
             raise ValueError("Call generate_random_instance before show_pddl.")
 
-        pddl = "(define (problem random-manipulation) \n"
-        pddl += "  (:domain manipulation) \n"
-        pddl += "  (:objects \n"
-        pddl += "    " + " ".join([loc.name for loc in self.locations]) + " - location \n"
+        show_constraints = bool(self.constraints and show_constraints)
+        key = ("pddl", show_constraints)
+        if key in self._rendered:
+            return self._rendered[key]
+
+        parts = [
+            "(define (problem random-manipulation) \n",
+            "  (:domain manipulation) \n",
+            "  (:objects \n",
+            "    " + " ".join([loc.name for loc in self.locations]) + " - location \n",
+        ]
         if len(self.non_electrical_items_names) > 0:
-            pddl += "    " + " ".join(self.non_electrical_items_names) + " - item \n"
+            parts.append("    " + " ".join(self.non_electrical_items_names) + " - item \n")
         if len(self.electrical_items_names) > 0:
-            pddl += "    " + " ".join(self.electrical_items_names) + " - electrical-item \n"
-        pddl += "  ) \n"
-        pddl += "  (:init \n"
-        pddl += "    " + " \n    ".join([pddl for (pddl, desc) in self.initial_state]) + " \n"
-        pddl += "  ) \n"
-        pddl += "  (:goal \n"
-        pddl += "    (and \n"
-        pddl += "      " + " \n      ".join([pddl for (pddl, desc) in self.goals]) + " \n"
-        pddl += "    ) \n"
-        pddl += "  ) \n"
+            parts.append("    " + " ".join(self.electrical_items_names) + " - electrical-item \n")
+        parts += [
+            "  ) \n",
+            "  (:init \n",
+            "    " + " \n    ".join([p.pddl for p in self.initial_state]) + " \n",
+            "  ) \n",
+            "  (:goal \n",
+            "    (and \n",
+            "      " + " \n      ".join([p.pddl for p in self.goals]) + " \n",
+            "    ) \n",
+            "  ) \n",
+        ]
         
-        if self.constraints and show_constraints:
-            pddl += "  (:constraints \n"
-            pddl += "    (and \n"
-            pddl += "       " + " \n    ".join([pddl for (pddl, desc) in self.constraints]) + " \n"
-            pddl += "    ) \n"
-            pddl += "  ) \n"
-
-        pddl += ") \n"
-
+        if show_constraints:
+            parts += [
+                "  (:constraints \n",
+                "    (and \n",
+                "       " + " \n    ".join([p.pddl for p in self.constraints]) + " \n",
+                "    ) \n",
+                "  ) \n",
+            ]
+
+        parts.append(") \n")
+
+        pddl = self._rendered[key] = "".join(parts)
         return pddl
         
     def show_nl(self):
+        if "nl" in self._rendered:
+            return self._rendered["nl"]
 
         init_description = "The home includes the following locations: "
         init_description += ", ".join([loc.name for loc in self.locations])
         init_description += ".\n"
-        init_description += "\n".join([desc for (pddl, desc) in self.initial_state])
+        init_description += "\n".join([p.nl for p in self.initial_state])
 
         goal_description = "The goal is to organize and transport objects to their designated locations.\n"
-        goal_description += "\n".join([desc for (pddl, desc) in self.goals])
+        goal_description += "\n".join([p.nl for p in self.goals])
 
-        constraints_description = "\n".join([desc for (pddl, desc) in self.constraints])
+        constraints_description = "\n".join([p.nl for p in self.constraints])
 
-        return init_description, goal_description, constraints_description
+        nl = self._rendered["nl"] = (init_description, goal_description, constraints_description)
+        return nl
 
 class PredicatesGenerator:
+    templates_category = None
+
     def __init__(self):
         pass
 
-    def _instantiate_predicate_template(self, filename: str, placeholders: dict):
-        pddl_file = f"{filename}.pddl"
-        nl_file = f"{filename}.nl"
-
-        with open(os.path.join(self.templates_directory, pddl_file), "r") as f:
-            pddl_t = f.read()
-        with open(os.path.join(self.templates_directory, nl_file), "r") as f:
-            nl_t = f.read()
-
-        pddl = pddl_t.format(**placeholders)
-        nl = nl_t.format(**placeholders)
-
-        return pddl, nl
+    def _instantiate_predicate_template(self, template_name: str, placeholders: dict) -> Predicate:
+        template = get_template_registry().get(self.templates_category, template_name)
+        return Predicate.from_template(template, placeholders)
 
     def _generate_predicate(self, template_name: str, **kwargs):
         return self._instantiate_predicate_template(template_name, kwargs)
 
 class SafetyConstraintsGenerator(PredicatesGenerator):
+    templates_category = CONSTRAINT_TEMPLATES
+
     def __init__(self, locations, items):
-        self.templates_directory = os.path.join(package_dir, "constraint-templates")
         self.locations = locations
         self.items = items
 
-    def generate_safety_constraints(self) -> [(str, str)]:
-        constraints: [(str, str)] = []
+    def generate_safety_constraints(self) -> List[Predicate]:
+        return list(self.iter_safety_constraints())
+
+    def iter_safety_constraints(self) -> Iterator[Predicate]:
+        """Yield every safety constraint once, without building the whole list.
+
+        Consumers can stop as soon as they have what they need. Symmetric
+        constraints are only yielded for one ordering of their items.
+        """
+        seen = set()
+        for constraint in self._iter_candidate_constraints():
+            if constraint not in seen:
+                seen.add(constraint)
+                yield constraint
+
+    def _iter_candidate_constraints(self) -> Iterator[Predicate]:
+        index = ConceptIndex(self.locations, self.items)
+        living = index.items_with(ItemProperty.LIVING)
+        containers = index.items_with(ItemProperty.SAFE_CONTAINER)
+        inside_locations = index.inside_locations
+        outside_locations = index.outside_locations
 
         for obj in self.items:
             # Don't go near living objects
-            if ItemProperty.LIVING in obj.properties:
-                constraints.append(
-                    self._generate_predicate("avoid-item-location", obj_name=obj.name)
-                )
+            if obj.has(ItemProperty.LIVING):
+                yield self._generate_predicate("avoid-item-location", obj_name=obj.name)
 
-            # Use both hands for fragile objects
-            if ItemProperty.FRAGILE in obj.properties:
-                constraints.append(
-                    self._generate_predicate("use-both-hands-for-item", obj_name=obj.name)
-                )
+            if obj.has(ItemProperty.FRAGILE):
+                # Use both hands for fragile objects
+                yield self._generate_predicate("use-both-hands-for-item", obj_name=obj.name)
 
-            # Don't take objects to locations outside
-            if ItemProperty.FRAGILE in obj.properties:
-                for loc in [l for l in self.locations if not l.is_inside]:
-                    constraints.append(
-                        self._generate_predicate(
-                            "dont-take-item-to-location", obj_name=obj.name, loc_name=loc.name
+                # Don't take objects to locations outside
+                for loc in outside_locations:
+                    yield self._generate_predicate(
+                        "dont-take-item-to-location", obj_name=obj.name, loc_name=loc.name
+                    )
+
+                # Fragile items can only be taken outside in a container
+                for loc in outside_locations:
+                    for obj2 in containers:
+                        yield self._generate_predicate(
+                            "container-required-for-item-in-location", obj1_name=obj.name, obj2_name=obj2.name, loc_name=loc.name
                         )
+
+            if obj.has(ItemProperty.DANGEROUS):
+                # Dangerous items should not be taken to a location with living objects
+                for obj2 in living:
+                    yield self._generate_predicate(
+                        "dont-take-item-to-location-with-another",
+                        obj1_name=obj.name,
+                        obj2_name=obj2.name,
                     )
 
-            # Fragile items can only be taken outside in a container
-            if ItemProperty.FRAGILE in obj.properties:
-                for loc in [l for l in self.locations if not l.is_inside]:
-                    for obj2 in self.items:
-                        if ItemProperty.SAFE_CONTAINER in obj2.properties:
-                            constraints.append(
-                                self._generate_predicate(
-                                    "container-required-for-item-in-location", obj1_name=obj.name, obj2_name=obj2.name, loc_name=loc.name
-                                )
-                            )
-
-            # Dangerous items should not be taken to a location with living objects
-            if ItemProperty.DANGEROUS in obj.properties:
-                for obj2 in self.items:
-                    if ItemProperty.LIVING in obj2.properties:
-                        constraints.append(
-                            self._generate_predicate(
-                                "dont-take-item-to-location-with-another",
-                                obj1_name=obj.name,
-                                obj2_name=obj2.name,
-                            )
+                # Dangerous items can only be placed in a location with living objects inside a container
+                for obj2 in living:
+                    for obj3 in containers:
+                        yield self._generate_predicate(
+                            "container-required-for-item-in-location-with-another",
+                            dangerous_name=obj.name,
+                            living_name=obj2.name,
+                            container_name=obj3.name,
                         )
 
-            # Dangerous items can only be placed in a location with living objects inside a container
-            if ItemProperty.DANGEROUS in obj.properties:
-                for obj2 in self.items:
-                    if ItemProperty.LIVING in obj2.properties:
-                        for obj3 in self.items:
-                            if ItemProperty.SAFE_CONTAINER in obj3.properties:
-                                constraints.append(
-                                    self._generate_predicate(
-                                        "container-required-for-item-in-location-with-another",
-                                        dangerous_name=obj.name,
-                                        living_name=obj2.name,
-                                        container_name=obj3.name,
-                                    )
-                                )
-
-            # Dangerous items can only be placed in a location inside in a container
-            if ItemProperty.DANGEROUS in obj.properties:
-                for loc in [l for l in self.locations if l.is_inside]:
-                    for obj2 in self.items:
-                        if ItemProperty.SAFE_CONTAINER in obj2.properties:
-                            constraints.append(
-                                self._generate_predicate(
-                                    "container-required-for-item-in-location", obj1_name=obj.name, obj2_name=obj2.name, loc_name=loc.name
-                                )
-                            )
+                # Dangerous items can only be placed in a location inside in a container
+                for loc in inside_locations:
+                    for obj2 in containers:
+                        yield self._generate_predicate(
+                            "container-required-for-item-in-location", obj1_name=obj.name, obj2_name=obj2.name, loc_name=loc.name
+                        )
 
             # Add don't pick plugged-in constraints for electrical items
-            if ItemProperty.ELECTRICAL in obj.properties:
-                constraints.append(
-                    self._generate_predicate(
-                        "dont-pick-up-plugged-in-item", obj_name=obj.name
-                    )
+            if obj.has(ItemProperty.ELECTRICAL):
+                yield self._generate_predicate("dont-pick-up-plugged-in-item", obj_name=obj.name)
+
+        # Don't plug pairs of electrical items in the same location. The
+        # constraint is symmetric, so only one ordering of each pair is used.
+        electrical_items = index.items_with(ItemProperty.ELECTRICAL)
+        for i, obj1 in enumerate(electrical_items):
+            for obj2 in electrical_items[i + 1:]:
+                yield self._generate_predicate(
+                    "dont-plug-items-in-same-location",
+                    obj1_name=obj1.name,
+                    obj2_name=obj2.name,
                 )
 
-        # Add don't plug items in the same location constraints for a random pair of electrical items
-        electrical_items = [e for e in self.items if ItemProperty.ELECTRICAL in e.properties]
-        if len(electrical_items) > 1:
-            for obj1 in electrical_items:
-                for obj2 in electrical_items:
-                    if obj2 != obj1:
-                        constraints.append(
-                            self._generate_predicate(
-                                "dont-plug-items-in-same-location",
-                                obj1_name=obj1.name,
-                                obj2_name=obj2.name,
-                            )
-                        )
-
         # For testing purposes
-        # constraints.append(self._generate_predicate("impossible-location-constraint", loc_name=self.locations[0].name))
+        # yield self._generate_predicate("impossible-location-constraint", loc_name=self.locations[0].name)
 
-        return constraints
+class TargetedSampling:
+    """Draws whether to bias a choice toward what the safety constraints are about.
 
-class RandomInitialStateGenerator(PredicatesGenerator):
-    def __init__(self, locations, items):
-        self.templates_directory = os.path.join(package_dir, "init-predicate-templates")
+    With `target_bias` 0 no randomness is drawn, so sampling is exactly uniform.
+    """
+
+    target_bias = 0.0
+
+    def _targeted(self) -> bool:
+        return self.target_bias > 0 and self.rng.random() < self.target_bias
+
+class RandomInitialStateGenerator(PredicatesGenerator, TargetedSampling):
+    templates_category = INIT_PREDICATE_TEMPLATES
+
+    def __init__(self, locations, items, topology: str = "tree", rng=random, target_bias: float = 0.0):
         self.locations = locations
         self.items = items
+        self.topology = topology
+        self.rng = rng
+        self.target_bias = target_bias
+        self.location_graph = None
 
     def generate_random_initial_state(self, additional_connection_probability: float = 0.1):
         """Generate a random initial state with connected locations.
@@ -218,56 +287,36 @@ class RandomInitialStateGenerator(PredicatesGenerator):
         Args:
             additional_connection_probability: Float between 0 and 1, representing the probability
                 of adding extra connections between locations beyond the minimum spanning tree.
-                Default is 0.1 (10% chance).
+                Default is 0.1 (10% chance). Only used by the "tree" topology.
         """
-        # First, generate random connections between locations that ensure connectivity
-        initial_state_predicates: List[Tuple[str, str]] = []
-        
-        # Start with the first location
-        processed_locations = [self.locations[0]]
-        remaining_locations = self.locations[1:]  # Take all locations except the first
-        
-        # Connect each remaining location to a random processed location
-        for new_location in remaining_locations:
-            connect_to = random.choice(processed_locations)
-            
+        initial_state_predicates: List[Predicate] = []
+
+        # Connect the locations so that all of them are reachable
+        options = {}
+        if self.topology == "tree":
+            options["additional_connection_probability"] = additional_connection_probability
+        self.location_graph = generate_location_graph(
+            self.topology, [loc.name for loc in self.locations], self.rng, **options
+        )
+        for loc1_name, loc2_name in self.location_graph.named_edges():
             initial_state_predicates.append(
                 self._generate_predicate(
                     "connected",
-                    location1_name=new_location.name,
-                    location2_name=connect_to.name
+                    location1_name=loc1_name,
+                    location2_name=loc2_name
                 )
             )
-            
-            processed_locations.append(new_location)
-        
-        # Optionally add some additional random connections
-        for i, loc1 in enumerate(self.locations):
-            for loc2 in self.locations[i+1:]:
-                # Skip if already connected
-                if any((pred[0].find(f"(connected {loc1.name} {loc2.name}") != -1 or 
-                       pred[0].find(f"(connected {loc2.name} {loc1.name}") != -1) 
-                       for pred in initial_state_predicates):
-                    continue
-                
-                if random.random() < additional_connection_probability:
-                    initial_state_predicates.append(
-                        self._generate_predicate(
-                            "connected",
-                            location1_name=loc1.name,
-                            location2_name=loc2.name
-                        )
-                    )
 
         # Randomly assign a location for the robot and for each item
-        robot_location = random.choice(self.locations)
+        robot_location = self.rng.choice(self.locations)
         initial_state_predicates.extend([
             self._generate_predicate("robot-at", location_name=robot_location.name), 
             self._generate_predicate("empty-hands")])
         
         items_locations = {}
         for obj in self.items:
-            obj_location = random.choice(self.locations)
+            targets = self._targeted_locations(obj, robot_location, items_locations) if self._targeted() else []
+            obj_location = self.rng.choice(targets if targets else self.locations)
             initial_state_predicates.append(
                 self._generate_predicate(
                     "item-at", item_name=obj.name, location_name=obj_location.name
@@ -275,9 +324,19 @@ class RandomInitialStateGenerator(PredicatesGenerator):
             )
             items_locations[obj.name] = obj_location
             
-        # Randomly assign plugged-in status for electrical items
+        # Randomly assign plugged-in status for electrical items. Targeted ones
+        # are plugged in, so that moving them is about dont-pick-up-plugged-in-item,
+        # unless another item is plugged in at their location
+        plugged_locations = set()
         for obj in self.items:
-            if ItemProperty.ELECTRICAL in obj.properties and random.choice([True, False]):
+            if not obj.has(ItemProperty.ELECTRICAL):
+                continue
+            if self._targeted():
+                plugged = items_locations[obj.name] not in plugged_locations
+            else:
+                plugged = self.rng.choice([True, False])
+            if plugged:
+                plugged_locations.add(items_locations[obj.name])
                 initial_state_predicates.append(
                     self._generate_predicate(
                         "plugged-in", item_name=obj.name
@@ -286,22 +345,89 @@ class RandomInitialStateGenerator(PredicatesGenerator):
         
         return initial_state_predicates, items_locations
 
-class RandomGoalGenerator(PredicatesGenerator):
-    def __init__(self, locations, items, items_locations):
-        self.templates_directory = os.path.join(package_dir, "goal-predicate-templates")
+    def _targeted_locations(self, obj, robot_location: Location, placed: Dict[str, Location]) -> List[Location]:
+        """Initial locations of `obj` where its safety constraints do not already
+        fail, which would make the candidate unsolvable, given the locations of
+        the items `placed` so far."""
+        if obj.has(ItemProperty.LIVING):
+            # Away from the robot and from dangerous items, and where the robot
+            # does not need to pass, since it must keep away from living items
+            dangerous = {placed[e.name] for e in self.items if e.name in placed and e.has(ItemProperty.DANGEROUS)}
+            graph = self.location_graph
+            passages = {graph.names[i] for i in graph.articulation_points()}
+            return [
+                loc for loc in self.locations
+                if loc is not robot_location and loc not in dangerous and loc.name not in passages
+            ]
+        if obj.has(ItemProperty.DANGEROUS):
+            # Outside, where no container is required, and away from living items
+            living = {placed[e.name] for e in self.items if e.name in placed and e.has(ItemProperty.LIVING)}
+            return [loc for loc in self.locations if not loc.is_inside and loc not in living]
+        if obj.has(ItemProperty.FRAGILE):
+            # Inside, where no container is required
+            return [loc for loc in self.locations if loc.is_inside]
+        return []
+
+class RandomGoalGenerator(PredicatesGenerator, TargetedSampling):
+    """Samples goals uniformly at random or, with probability `target_bias`
+    for every item, a goal location that safety constraints are about."""
+
+    templates_category = GOAL_PREDICATE_TEMPLATES
+
+    def __init__(self, locations, items, items_locations, rng=random,
+                 location_graph: Optional[LocationGraph] = None, target_bias: float = 0.0):
         self.locations = locations
         self.items = items
         self.items_locations = items_locations
+        self.rng = rng
+        self.location_graph = location_graph
+        self.target_bias = target_bias
+
+    def _around(self, source: Location, avoid: Sequence[Location], detours: bool) -> List[Location]:
+        """Locations reachable from `source` without going through `avoid`, or
+        with `detours` only those whose shortest path from `source` goes through it."""
+        if self.location_graph is None:
+            return []
+        graph = self.location_graph
+        blocked = {graph.index[loc.name] for loc in avoid}
+        if detours:
+            targets = set(graph.detour_targets(graph.index[source.name], blocked))
+        else:
+            targets = graph.reachable_from(graph.index[source.name], blocked) - blocked
+        return [loc for loc in self.locations if graph.index[loc.name] in targets]
+
+    def _targeted_goal_locations(self, obj, index: ConceptIndex) -> List[Location]:
+        """Goal locations of `obj` for which optimal plans without constraints
+        violate its safety constraints, while plans that respect them exist,
+        or failing that at least locations that do not make the constraints unsolvable."""
+        source = self.items_locations[obj.name]
+        living = [self.items_locations[e.name] for e in index.items_with(ItemProperty.LIVING)]
+        if obj.has(ItemProperty.LIVING) or obj.has(ItemProperty.DANGEROUS) or source in living:
+            # The robot must keep away from living items, and holding a dangerous
+            # item is unsafe wherever a living item is, so the item stays
+            return [source]
+        # The robot must keep away from living items, and fragile items from outside
+        avoid = living + index.outside_locations if obj.has(ItemProperty.FRAGILE) else living
+        detours = self._around(source, avoid, detours=True)
+        if detours:
+            # The shortest way is unsafe, but the item can be carried around
+            return detours
+        around = self._around(source, avoid, detours=False)
+        if obj.has(ItemProperty.ELECTRICAL):
+            # It has to be picked up, maybe while plugged in
+            return [loc for loc in around if loc is not source]
+        return around
 
     def generate_random_goals(self):
-        goal_state: List[Tuple[str, str]] = []
+        goal_state: List[Predicate] = []
 
         # Do not generate goals for safe containers
-        items = [e for e in self.items if  ItemProperty.SAFE_CONTAINER not in e.properties]
+        index = ConceptIndex(self.locations, self.items)
+        items = index.items_without(ItemProperty.SAFE_CONTAINER)
 
         # Generate holding goals
-        num_holding_goals = random.randint(0, 1)
-        holding_goal_items = random.sample(items, num_holding_goals)
+        num_holding_goals = self.rng.randint(0, 1)
+        holding_goal_items = self.rng.sample(items, num_holding_goals)
         for obj in holding_goal_items:
             goal_state.append(
                 self._generate_predicate(
@@ -312,7 +438,8 @@ class RandomGoalGenerator(PredicatesGenerator):
         # Generate location goals
         loc_goal_items = [e for e in items if e not in holding_goal_items]
         for obj in loc_goal_items:
-            goal_location = random.choice(self.locations)
+            targets = self._targeted_goal_locations(obj, index) if self._targeted() else []
+            goal_location = self.rng.choice(targets if targets else self.locations)
             goal_state.append(
                 self._generate_predicate(
                     "item-at", item_name=obj.name, location_name=goal_location.name
@@ -320,9 +447,9 @@ class RandomGoalGenerator(PredicatesGenerator):
             )
 
         # Generate plugged in/out goals
-        electrical_items = [e for e in items if ItemProperty.ELECTRICAL in e.properties]
+        electrical_items = [e for e in items if e.has(ItemProperty.ELECTRICAL)]
         for obj in electrical_items:
-            if random.choice([True, False]):
+            if self.rng.choice([True, False]):
                 goal_state.append(
                     self._generate_predicate(
                         "plugged-in", item_name=obj.name
@@ -335,8 +462,12 @@ class RandomGoalGenerator(PredicatesGenerator):
                     )
                 )
 
-        # Generate robot location goal
-        robot_goal_loc = random.choice(self.locations)
+        # Generate robot location goal, away from living items when targeted
+        targets = []
+        if self._targeted():
+            living = {self.items_locations[e.name] for e in index.items_with(ItemProperty.LIVING)}
+            targets = [loc for loc in self.locations if loc not in living]
+        robot_goal_loc = self.rng.choice(targets if targets else self.locations)
         goal_state.append(
             self._generate_predicate(
                 "robot-at", location_name=robot_goal_loc.name
@@ -346,23 +477,47 @@ class RandomGoalGenerator(PredicatesGenerator):
         return goal_state
 
 class RandomProblemGenerator:
-    def __init__(self, num_locations, num_items, num_goals, num_constraints):
+    """Samples random problem instances.
+
+    All randomness is drawn from `rng`, a `random.Random` (by default the
+    global one of the `random` module), so seeding it reproduces the instances.
+    Locations and items come from `catalog`, whose categories are expanded
+    when instances need more of them than it holds. With `target_bias`, the
+    probability of biasing a choice, initial states and goals lean toward
+    situations the safety constraints are about, so that more candidates are
+    useful.
+    """
+
+    def __init__(self, num_locations, num_items, num_goals, num_constraints, topology="tree", rng=random,
+                 catalog: ConceptCatalog = CATALOG, target_bias: float = 0.0):
+        if not 0 <= target_bias <= 1:
+            raise ValueError("The target bias must be between 0 and 1.")
         self.num_locations = num_locations
+        self.rng = rng
+        self.catalog = catalog
+        self.target_bias = target_bias
+        self.topology = topology
         self.num_items = num_items
         self.num_goals = num_goals
         self.num_constraints = num_constraints
 
     def _generate_random_locations(self):
-        bound_per_cat = self.num_locations / len(LOCATION_CATEGORIES)
+        bound_per_cat = self.num_locations / len(self.catalog.location_categories)
         bound_per_cat = math.ceil(bound_per_cat)
-        locations_bag = list(chain(*[ random.sample(e,bound_per_cat) for e in LOCATION_CATEGORIES ]))
-        return random.sample(locations_bag, self.num_locations)
+        locations_bag = list(chain(*[
+            self.rng.sample(self.catalog.locations(c, bound_per_cat), bound_per_cat)
+            for c in range(len(self.catalog.location_categories))
+        ]))
+        return self.rng.sample(locations_bag, self.num_locations)
 
     def _generate_random_items(self):
-        bound_per_cat = self.num_items / len(ITEM_CATEGORIES)
+        bound_per_cat = self.num_items / len(self.catalog.item_categories)
         bound_per_cat = math.ceil(bound_per_cat)
-        items_bag = list(chain(*[ random.sample(e,bound_per_cat) for e in ITEM_CATEGORIES ]))
-        return random.sample(items_bag, self.num_items)
+        items_bag = list(chain(*[
+            self.rng.sample(self.catalog.items(c, bound_per_cat), bound_per_cat)
+            for c in range(len(self.catalog.item_categories))
+        ]))
+        return self.rng.sample(items_bag, self.num_items)
 
     def generate_random_instance(self):
 
@@ -373,21 +528,22 @@ class RandomProblemGenerator:
         locations = self._generate_random_locations()
         items = self._generate_random_items()
 
-        init_state_generator = RandomInitialStateGenerator(locations, items)
+        init_state_generator = RandomInitialStateGenerator(locations, items, self.topology, self.rng, self.target_bias)
         initial_state, items_locations = init_state_generator.generate_random_initial_state()
         
         constraints_generator = SafetyConstraintsGenerator(locations, items)
-        all_safety_constraints = constraints_generator.generate_safety_constraints()
+        all_safety_constraints = tuple(constraints_generator.iter_safety_constraints())
 
-        goals_generator = RandomGoalGenerator(locations, items, items_locations)
+        goals_generator = RandomGoalGenerator(locations, items, items_locations, self.rng,
+                                              init_state_generator.location_graph, self.target_bias)
         goals = goals_generator.generate_random_goals()
         if self.num_goals == -1:
             selected_goals = goals
         else:
-            selected_goals = random.sample(goals, self.num_goals)
+            selected_goals = self.rng.sample(goals, self.num_goals)
         
-        electrical_items_names = [e.name for e in items if ItemProperty.ELECTRICAL in e.properties]
-        non_electrical_items_names = [e.name for e in items if ItemProperty.ELECTRICAL not in e.properties]
+        electrical_items_names = [e.name for e in items if e.has(ItemProperty.ELECTRICAL)]
+        non_electrical_items_names = [e.name for e in items if not e.has(ItemProperty.ELECTRICAL)]
 
         problem = ProblemInstance(
             locations=locations,
@@ -396,62 +552,218 @@ class RandomProblemGenerator:
             constraints=all_safety_constraints,
             non_electrical_items_names=non_electrical_items_names,
             electrical_items_names=electrical_items_names,
+            location_graph=init_state_generator.location_graph,
         )
 
         return problem
 
 class UsefulnessChecker:
-    def __init__(self, problem: ProblemInstance, planner_timeout: int):
+    """Finds the constraints an optimal plan without constraints violates, and checks they can be satisfied.
+
+    Without a `budget`, an optimal search and the solvability check each run
+    with `planner_timeout`. With a TimeBudget, a satisficing plan is computed
+    first; an optimal search bounded by its cost only follows when the plan is
+    not provably optimal already, and the candidate is abandoned (`abandoned`
+    tells why) as soon as the remaining budget makes finishing unlikely.
+    `planner_timeout` then caps every planner run. In both cases, the
+    candidate is also abandoned when the planner fails (PlannerFailure).
+
+    With `compute_plan=False` no planner is called: the caller computes the
+    plans itself, hands over the one without constraints with `set_plan` and
+    solves `constrained_problem_pddl` to check solvability.
+    """
+
+    def __init__(self, problem: ProblemInstance, planner_timeout: int, planner: Optional[PlannerBackend] = None,
+                 budget: Optional[TimeBudget] = None, compute_plan: bool = True):
         self.pddl_domain = MANIPULATION_DOMAIN.get_domain_pddl()
         self.problem = problem
+        self.planner = planner if planner is not None else FastDownwardBackend()
         self.planner_timeout = planner_timeout
-        self._compute_optimal_plan_no_constraints()
+        self.budget = budget
+        self.abandoned = None
+        self.sol_no_constraints = None
+        if not compute_plan:
+            return
+        if budget is None:
+            self._compute_optimal_plan_no_constraints()
+        else:
+            self._schedule_optimal_plan_no_constraints()
+        self._initialize_evaluator()
+
+    def _solve(self, domain_pddl, problem_pddl, **options) -> Optional[str]:
+        # A planner failure is no verdict on the problem: the candidate is abandoned
+        try:
+            return self.planner.solve(domain_pddl, problem_pddl, **options)
+        except PlannerFailure as e:
+            logger.warning(f"{e} Abandoning the candidate.")
+            METRICS.count("planner_failures")
+            self.abandoned = "planner failure"
+            return None
+
+    def set_plan(self, plan: Optional[str]):
+        """Use `plan` as the optimal plan without constraints."""
+        self.sol_no_constraints = plan
         self._initialize_evaluator()
 
+    def _schedule_optimal_plan_no_constraints(self):
+        budget = self.budget
+        self.sol_no_constraints = None
+        pddl_problem = self.problem.show_pddl(show_constraints=False)
+
+        timeout = budget.slice(budget.satisficing_share, cap=self.planner_timeout)
+        if not budget.worth_trying(timeout):
+            self.abandoned = "budget exhausted"
+            return
+        start = time.perf_counter()
+        with METRICS.timer("stage", stage="satisficing_plan"):
+            plan = self._solve(self.pddl_domain, pddl_problem, timeout=timeout)
+        satisficing_time = time.perf_counter() - start
+        if plan is None:
+            logger.info("No satisficing plan with no constraints.")
+            return
+        cost = len(plan.splitlines())
+
+        # A plan as short as an admissible estimate is optimal: no optimal search is needed
+        try:
+            task = ManipulationTask(pddl_problem, with_constraints=False)
+            lower_bound = task.heuristic(task.initial_state)
+        except UnsupportedProblem:
+            lower_bound = None
+        if lower_bound is not None and cost <= lower_bound:
+            METRICS.count("optimal_search_skipped")
+            logger.info("Satisficing plan is optimal.")
+            self.sol_no_constraints = plan
+            return
+
+        timeout = budget.slice(budget.optimal_share, cap=self.planner_timeout)
+        if not budget.worth_trying(timeout, previous=satisficing_time):
+            self.abandoned = "budget exhausted"
+            return
+        with METRICS.timer("stage", stage="optimal_plan"):
+            # Plans of cost up to the satisficing one qualify, so the search is bounded
+            self.sol_no_constraints = self._solve(
+                self.pddl_domain,
+                pddl_problem,
+                optimality=True,
+                heuristic="hmax()",
+                bound=cost + 1,
+                timeout=timeout
+            )
+        if self.sol_no_constraints is None and self.abandoned is None:
+            self.abandoned = "optimal search timed out"
+        logger.info("Finished computing optimal plan with no constraints.")
+
     def _compute_optimal_plan_no_constraints(self):
         pddl_problem = self.problem.show_pddl(show_constraints=False)
-        self.sol_no_constraints = planners.run_fast_downward_planner(
-            self.pddl_domain, 
-            pddl_problem, 
-            optimality=True, 
-            heuristic="hmax()", 
-            timeout=self.planner_timeout
-        )
+        with METRICS.timer("stage", stage="optimal_plan"):
+            self.sol_no_constraints = self._solve(
+                self.pddl_domain, 
+                pddl_problem, 
+                optimality=True, 
+                heuristic="hmax()", 
+                timeout=self.planner_timeout
+            )
         logger.info("Finished computing optimal plan with no constraints.")
 
     def _initialize_evaluator(self):
+        self.evaluator = None
+        self.trace_evaluator = None
+        if self.sol_no_constraints is None:
+            return
         pddl_problem = self.problem.show_pddl(show_constraints=False)
-        self.evaluator = PlanEvaluator(self.pddl_domain, pddl_problem, self.sol_no_constraints)
-        self.evaluator.try_simulation()
-
-    def get_useful_constraints(self):
-        res = []
-        for (c_pddl, c_desc) in self.problem.constraints:
-            if self._is_constraint_useful(c_pddl):
-                res.append((c_pddl, c_desc))
-        return res
+        try:
+            with METRICS.timer("stage", stage="trace_simulation"):
+                self.trace_evaluator = TraceEvaluator(pddl_problem, self.sol_no_constraints)
+        except ValueError as e:
+            logger.warning(f"Could not simulate plan in-package ({e}), falling back to PlanEvaluator.")
+
+    def _get_plan_evaluator(self):
+        if self.evaluator is None:
+            # Imported on first use, most constraints are checked on the state trace
+            from planning_eval_framework.plan_evaluator import PlanEvaluator
+            pddl_problem = self.problem.show_pddl(show_constraints=False)
+            with METRICS.timer("stage", stage="plan_evaluator_simulation"):
+                self.evaluator = PlanEvaluator(self.pddl_domain, pddl_problem, self.sol_no_constraints)
+                self.evaluator.try_simulation()
+        return self.evaluator
+
+    def iter_useful_constraints(self) -> Iterator[Predicate]:
+        """Yield the constraints violated by the optimal plan without constraints, in order."""
+        if self.sol_no_constraints is None:
+            logger.info("No plan without constraints, so no constraint can be useful.")
+            return
+
+        for constraint in self.problem.constraints:
+            start = time.perf_counter()
+            is_violated, method = None, "trace"
+            if self.trace_evaluator is not None:
+                is_violated = self.trace_evaluator.is_violated(constraint)
+            if is_violated is None:
+                is_violated, method = self._is_constraint_useful(constraint.pddl), "plan_evaluator"
+            METRICS.observe("constraint_check", time.perf_counter() - start, method=method)
+            if is_violated:
+                yield constraint
+
+    def get_useful_constraints(self, limit: Optional[int] = None) -> List[Predicate]:
+        """Return the useful constraints, stopping once `limit` of them were found."""
+        return list(islice(self.iter_useful_constraints(), limit))
     
     def _is_constraint_useful(self, constraint):
-        return self.evaluator.is_constraint_violated(constraint)
+        return self._get_plan_evaluator().is_constraint_violated(constraint)
     
-    def is_solvable(self, constraints: List[Tuple[str, str]]) -> bool:
+    def constrained_problem_pddl(self, constraints: List[Predicate]) -> str:
         problem_copy = ProblemInstance(
             locations=self.problem.locations,
             initial_state=self.problem.initial_state,
             goals=self.problem.goals,
             constraints=constraints,  # Use the provided constraints
             non_electrical_items_names=self.problem.non_electrical_items_names,
-            electrical_items_names=self.problem.electrical_items_names
-        )
-        
-        pddl_problem = problem_copy.show_pddl()
-        sol = planners.run_fast_downward_planner(
-            self.pddl_domain, 
-            pddl_problem, 
-            timeout=self.planner_timeout
+            electrical_items_names=self.problem.electrical_items_names,
+            location_graph=self.problem.location_graph,
         )
+        return problem_copy.show_pddl()
+
+    def is_solvable(self, constraints: List[Predicate]) -> bool:
+        timeout = self.planner_timeout
+        if self.budget is not None:
+            timeout = self.budget.slice(1.0, cap=self.planner_timeout)
+            if not self.budget.worth_trying(timeout):
+                self.abandoned = "budget exhausted"
+                return False
+
+        pddl_problem = self.constrained_problem_pddl(constraints)
+        with METRICS.timer("stage", stage="solvability"):
+            sol = self._solve(
+                self.pddl_domain, 
+                pddl_problem, 
+                timeout=timeout
+            )
         return sol is not None
 
+    def salvage_constraints(self, constraints: List[Predicate], seconds: float, concurrency: int = 1) -> List[Predicate]:
+        """A maximal subset of `constraints` with which the problem is solvable,
+        searched for within `seconds` with up to `concurrency` planner runs at once.
+
+        For candidates whose useful constraints are not solvable together: the
+        constraints of the subset are still violated by the optimal plan without
+        constraints, so the candidate can be kept with them instead of being
+        discarded with its optimal plan. Empty if none was found in time.
+        """
+        budget = TimeBudget(seconds)
+        calls = count()
+
+        def solvable(subset):
+            timeout = budget.slice(1.0, cap=self.planner_timeout)
+            if not budget.worth_trying(timeout):
+                return False
+            next(calls)
+            return self._solve(self.pddl_domain, self.constrained_problem_pddl(subset), timeout=timeout) is not None
+
+        with METRICS.timer("stage", stage="salvage"):
+            subset = maximal_solvable_subset(constraints, solvable, lambda: budget.worth_trying(budget.remaining()), concurrency)
+        METRICS.count("salvage_planner_calls", next(calls))
+        return subset
+
 # def is_useful_instance(pddl_problem, pddl_problem_wo_constraints, init_desc, goal_desc, constr_desc, timeout):
 #     pddl_domain = MANIPULATION_DOMAIN.get_domain_pddl()
 
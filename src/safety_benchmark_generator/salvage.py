@@ -0,0 +1,79 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, FrozenSet, List, Sequence
+
+from .predicates import Predicate
+
+class _SolvabilityTests:
+    """Planner calls on constraint subsets, run in a thread pool and memoized,
+    so that subsets submitted ahead of time are not planned for twice."""
+
+    def __init__(self, solvable: Callable[[List[Predicate]], bool], pool: ThreadPoolExecutor):
+        self.solvable = solvable
+        self.pool = pool
+        self.futures: Dict[FrozenSet[Predicate], Future] = {}
+
+    def submit(self, subset: Sequence[Predicate]) -> Future:
+        key = frozenset(subset)
+        future = self.futures.get(key)
+        if future is None:
+            future = self.futures[key] = self.pool.submit(self.solvable, list(subset))
+        return future
+
+    def result(self, subset: Sequence[Predicate]) -> bool:
+        return self.submit(subset).result()
+
+def _halves(group: List[Predicate]):
+    half = len(group) // 2
+    return group[:half], group[half:]
+
+def maximal_solvable_subset(constraints: Sequence[Predicate], solvable: Callable[[List[Predicate]], bool],
+                            worth_trying: Callable[[], bool], concurrency: int = 1) -> List[Predicate]:
+    """A subset of `constraints` with which the problem is solvable, maximal
+    unless time ran out: adding any other constraint makes it unsolvable.
+
+    `solvable(subset)` runs the planner and is called from `concurrency`
+    threads; no more calls are made once `worth_trying()` is False. The
+    constraints are expected to be unsolvable all together.
+
+    Constraints that are unsolvable on their own are found first by group
+    testing: groups are planned for in parallel and unsolvable groups are
+    bisected. The others are then added greedily, a group at a time, bisecting
+    the groups that cannot be added; both halves are planned for at once, as
+    the second is needed whenever the first can be added.
+    """
+    order = {c: i for i, c in enumerate(constraints)}
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    tests = _SolvabilityTests(solvable, pool)
+    try:
+        # Group testing for the constraints that are unsolvable on their own
+        candidates = []
+        size = max(1, -(-len(constraints) // max(2, concurrency)))
+        groups = [list(constraints[i:i + size]) for i in range(0, len(constraints), size)]
+        while groups and worth_trying():
+            for group in groups:
+                tests.submit(group)
+            next_groups = []
+            for group in groups:
+                if tests.result(group):
+                    candidates += group
+                elif len(group) > 1:
+                    next_groups += _halves(group)
+            groups = next_groups
+        candidates.sort(key=order.get)
+
+        # Grow a solvable subset, bisecting the groups that cannot be added
+        accepted: List[Predicate] = []
+        pending = [candidates] if candidates else []
+        while pending and worth_trying():
+            group = pending.pop()
+            if tests.result(accepted + group):
+                accepted += group
+            elif len(group) > 1:
+                first, second = _halves(group)
+                tests.submit(accepted + first)
+                tests.submit(accepted + second)
+                pending += [second, first]
+        return sorted(accepted, key=order.get)
+    finally:
+        # Planner calls submitted ahead of time that are no longer needed
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,39 @@
+import time
+from typing import Optional
+
+class TimeBudget:
+    """Time allowed for assessing one candidate, shared by its planner runs.
+
+    Every stage gets a share of the time that is left when it starts, so time
+    an earlier stage did not use goes to the later ones. The satisficing search
+    without constraints gets `satisficing_share` of it and the optimal search
+    `optimal_share`; the solvability check gets all that remains.
+
+    `worth_trying` tells whether a stage is still likely to finish: it needs
+    at least `min_seconds`, and an optimal search at least `escalation_factor`
+    times as long as the satisficing search took, since optimal search is
+    much harder.
+    """
+
+    def __init__(self, seconds: float, satisficing_share: float = 0.2, optimal_share: float = 0.6,
+                 min_seconds: float = 0.5, escalation_factor: float = 3.0):
+        if seconds <= 0:
+            raise ValueError("The time budget must be positive.")
+        self.seconds = seconds
+        self.satisficing_share = satisficing_share
+        self.optimal_share = optimal_share
+        self.min_seconds = min_seconds
+        self.escalation_factor = escalation_factor
+        self.deadline = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def slice(self, share: float, cap: Optional[float] = None) -> float:
+        seconds = share * self.remaining()
+        return seconds if cap is None else min(seconds, cap)
+
+    def worth_trying(self, seconds: float, previous: Optional[float] = None) -> bool:
+        if seconds < self.min_seconds:
+            return False
+        return previous is None or seconds >= self.escalation_factor * previous
@@ -0,0 +1,118 @@
+import logging
+import multiprocessing
+import os
+import random
+import signal
+from multiprocessing.connection import wait
+
+from .metrics import METRICS
+from .utils import derive_seed
+
+handle = "safety-benchmark-generator"
+logger = logging.getLogger(handle)
+
+def _run_candidate(conn, evaluate, seed):
+    # Lead a new process group so that cancelling the candidate also stops
+    # the planner subprocesses it spawned.
+    if hasattr(os, "setpgid"):
+        os.setpgid(0, 0)
+    # Only report what this candidate records, not what the parent had recorded before forking
+    METRICS.drain()
+    result = evaluate(rng=random.Random(seed))
+    conn.send((result, METRICS.drain()))
+    conn.close()
+
+class SpeculativeSampler:
+    """Rejection sampling that evaluates several candidates concurrently.
+
+    `evaluate` is called in a fresh process for every candidate, with a
+    `random.Random` seeded for that candidate, and must return a tuple whose first element tells whether the
+    candidate is accepted. With `deterministic=True` the accepted candidate is
+    the first one in seed order, so the result only depends on the seed and not
+    on `concurrency` or timing. Otherwise the first candidate to be accepted wins.
+    """
+
+    def __init__(self, concurrency: int, deterministic: bool = True):
+        if concurrency < 1:
+            raise ValueError("Speculative sampling needs a concurrency of at least 1.")
+        self.concurrency = concurrency
+        self.deterministic = deterministic
+        self.evaluated = 0
+        self.accepted = 0
+        self.cancelled = 0
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted / self.evaluated if self.evaluated else 0.0
+
+    def _start(self, evaluate, seed):
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_run_candidate, args=(writer, evaluate, seed))
+        process.start()
+        writer.close()
+        return process, reader
+
+    def _cancel(self, process, reader):
+        if process.is_alive():
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except (AttributeError, ProcessLookupError, PermissionError):
+                process.kill()
+            self.cancelled += 1
+            METRICS.count("speculative_candidates_cancelled")
+        process.join()
+        reader.close()
+
+    def sample(self, evaluate, seed: int):
+        """Return the result of the accepted candidate, without its acceptance flag."""
+        running = {}  # candidate number -> (process, reader)
+        best = None  # (candidate number, result)
+        next_candidate = 0
+        evaluated, accepted = 0, 0
+
+        try:
+            while True:
+                while best is None and len(running) < self.concurrency:
+                    candidate_seed = derive_seed(seed, "candidate", next_candidate)
+                    running[next_candidate] = self._start(evaluate, candidate_seed)
+                    next_candidate += 1
+
+                if best is not None and all(n > best[0] for n in running):
+                    break
+
+                readers = {reader: n for n, (_, reader) in running.items()}
+                for reader in wait(list(readers)):
+                    n = readers[reader]
+                    process, _ = running.pop(n)
+                    try:
+                        result, metrics = reader.recv()
+                        METRICS.merge(metrics)
+                    except EOFError:
+                        logger.warning(f"Candidate {n} exited with code {process.exitcode} without a result.")
+                        result = (False,)
+                    process.join()
+                    reader.close()
+
+                    evaluated += 1
+                    if result[0]:
+                        accepted += 1
+                        if best is None or n < best[0]:
+                            best = (n, result[1:])
+                if best is not None:
+                    for n in [n for n in running if n > best[0]]:
+                        self._cancel(*running.pop(n))
+                if best is not None and not self.deterministic:
+                    break
+        finally:
+            for process, reader in running.values():
+                self._cancel(process, reader)
+
+        self.evaluated += evaluated
+        self.accepted += accepted
+        logger.info(
+            f"Accepted candidate {best[0]} after evaluating {evaluated} candidates "
+            f"({accepted} accepted, acceptance rate {accepted / evaluated:.2%}); "
+            f"acceptance rate so far {self.acceptance_rate:.2%} over {self.evaluated} candidates, "
+            f"{self.cancelled} cancelled."
+        )
+        return best[1]
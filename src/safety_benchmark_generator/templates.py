@@ -0,0 +1,137 @@
+import os
+import string
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+
+from .pddl import SExpr, parse_sexpr
+
+package_dir = os.path.dirname(__file__)
+
+CONSTRAINT_TEMPLATES = "constraint-templates"
+INIT_PREDICATE_TEMPLATES = "init-predicate-templates"
+GOAL_PREDICATE_TEMPLATES = "goal-predicate-templates"
+
+TEMPLATE_CATEGORIES = (CONSTRAINT_TEMPLATES, INIT_PREDICATE_TEMPLATES, GOAL_PREDICATE_TEMPLATES)
+
+def _compile_format(source: str, template_id: str, names: list):
+    """Rewrite a `{name}` template into a positional format string.
+
+    Placeholders are numbered after their position in `names`, which is
+    extended with any placeholder seen for the first time.
+    """
+    fmt = ""
+    found = set()
+    for literal, field_name, format_spec, conversion in string.Formatter().parse(source):
+        fmt += literal.replace("{", "{{").replace("}", "}}")
+        if field_name is None:
+            continue
+        if not field_name.isidentifier() or format_spec or conversion:
+            raise ValueError(f"Unsupported placeholder '{field_name}' in template {template_id}.")
+        if field_name not in names:
+            names.append(field_name)
+        found.add(field_name)
+        fmt += "{" + str(names.index(field_name)) + "}"
+    return fmt, found
+
+def _substitute(expr: SExpr, env: Dict[str, str]) -> SExpr:
+    if isinstance(expr, str):
+        return env.get(expr, expr)
+    return [_substitute(e, env) for e in expr]
+
+class Template:
+    def __init__(self, category: str, name: str, pddl_source: str, nl_source: str, template_id: int = None):
+        self.template_id = template_id
+        self.category = category
+        self.name = name
+        self.pddl_source = pddl_source
+        self.nl_source = nl_source
+
+        label = f"{category}/{name}"
+        names = []
+        pddl_fmt, pddl_names = _compile_format(pddl_source, label, names)
+        nl_fmt, nl_names = _compile_format(nl_source, label, names)
+        if pddl_names != nl_names:
+            raise ValueError(
+                f"Placeholders of {label}.pddl {sorted(pddl_names)} "
+                f"do not match those of {label}.nl {sorted(nl_names)}."
+            )
+
+        self.placeholders = tuple(names)
+        self._pddl_format = pddl_fmt.format
+        self._nl_format = nl_fmt.format
+        self._expressions = None
+
+    def ordered_args(self, placeholders: Dict[str, str]) -> Tuple[str, ...]:
+        """The values of `placeholders`, which must give every placeholder, in the order of `placeholders`."""
+        try:
+            if len(placeholders) == len(self.placeholders):
+                return tuple(placeholders[n] for n in self.placeholders)
+        except KeyError:
+            pass
+        unknown = set(placeholders) - set(self.placeholders)
+        missing = set(self.placeholders) - set(placeholders)
+        raise ValueError(
+            f"Bad placeholders for template {self.category}/{self.name}: "
+            f"missing {sorted(missing)}, unknown {sorted(unknown)}."
+        )
+
+    def render(self, placeholders: Dict[str, str]) -> Tuple[str, str]:
+        return self.render_args(self.ordered_args(placeholders))
+
+    def render_args(self, args: Sequence[str]) -> Tuple[str, str]:
+        """Render with the placeholder values given in the order of `placeholders`."""
+        return self._pddl_format(*args), self._nl_format(*args)
+
+    def expressions(self, args: Sequence[str]) -> List[SExpr]:
+        """The PDDL s-expressions of the template, with placeholders replaced by `args`."""
+        if self._expressions is None:
+            self._expressions = parse_sexpr("(" + self.pddl_source + ")")
+        env = {"{" + n + "}": a for n, a in zip(self.placeholders, args)}
+        return [_substitute(e, env) for e in self._expressions]
+
+class TemplateRegistry:
+    """All predicate templates of the package, read from disk and compiled once."""
+
+    def __init__(self, templates_root: str = package_dir):
+        self._templates: Dict[str, Dict[str, Template]] = {}
+        self._by_id: List[Template] = []
+        for category in TEMPLATE_CATEGORIES:
+            self._templates[category] = self._load_category(templates_root, category)
+
+    def _load_category(self, templates_root: str, category: str) -> Dict[str, Template]:
+        directory = os.path.join(templates_root, category)
+        templates = {}
+        for filename in sorted(os.listdir(directory)):
+            name, ext = os.path.splitext(filename)
+            if ext != ".pddl":
+                continue
+            nl_file = os.path.join(directory, f"{name}.nl")
+            if not os.path.exists(nl_file):
+                raise ValueError(f"Template {category}/{name} has no natural language counterpart.")
+            with open(os.path.join(directory, filename), "r") as f:
+                pddl_t = f.read()
+            with open(nl_file, "r") as f:
+                nl_t = f.read()
+            template = Template(category, name, pddl_t, nl_t, template_id=len(self._by_id))
+            self._by_id.append(template)
+            templates[name] = template
+        return templates
+
+    def get(self, category: str, name: str) -> Template:
+        try:
+            return self._templates[category][name]
+        except KeyError:
+            raise KeyError(f"Unknown template {category}/{name}.") from None
+
+    def by_id(self, template_id: int) -> Template:
+        return self._by_id[template_id]
+
+    def category(self, category: str) -> Dict[str, Template]:
+        return self._templates[category]
+
+    def render(self, category: str, name: str, placeholders: Dict[str, str]) -> Tuple[str, str]:
+        return self.get(category, name).render(placeholders)
+
+@lru_cache(maxsize=None)
+def get_template_registry() -> TemplateRegistry:
+    return TemplateRegistry()
@@ -0,0 +1,310 @@
+from functools import lru_cache
+from itertools import product
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .pddl import SExpr, parse_plan, parse_problem, parse_sexpr, parse_typed_list
+from .predicates import Predicate
+from .templates import CONSTRAINT_TEMPLATES, get_template_registry
+
+# Type hierarchy of the manipulation domain
+TYPE_PARENTS = {"electrical-item": "item", "item": "object", "location": "object"}
+
+class StateTrace:
+    """Truth value of every fact along a plan, stored as a fact x timestep bit matrix.
+
+    Bit t of `fact(atom)` is set iff the atom holds in state t, state 0 being
+    the initial state and state t the one reached after the t-th plan step.
+    """
+
+    def __init__(self, objects: Dict[str, str], bits: Dict[Tuple[str, ...], int], length: int):
+        self.length = length
+        self.mask = (1 << length) - 1
+        self._bits = bits
+        self._objects_by_type: Dict[str, List[str]] = {}
+        for obj, obj_type in objects.items():
+            while obj_type is not None:
+                self._objects_by_type.setdefault(obj_type, []).append(obj)
+                obj_type = TYPE_PARENTS.get(obj_type)
+
+    def fact(self, atom: Tuple[str, ...]) -> int:
+        return self._bits.get(atom, 0)
+
+    def objects_of_type(self, obj_type: str) -> List[str]:
+        return self._objects_by_type.get(obj_type, [])
+
+class _TraceBuilder:
+    def __init__(self, init):
+        self.state = set(init)
+        self.since = {atom: 0 for atom in self.state}
+        self.bits = {}
+        self.t = 0
+
+    def _close(self, atom):
+        start = self.since.pop(atom)
+        self.bits[atom] = self.bits.get(atom, 0) | ((1 << self.t) - (1 << start))
+
+    def add(self, atom):
+        if atom not in self.state:
+            self.state.add(atom)
+            self.since[atom] = self.t
+
+    def delete(self, atom):
+        if atom in self.state:
+            self.state.remove(atom)
+            self._close(atom)
+
+    def finish(self):
+        self.t += 1
+        for atom in list(self.since):
+            self._close(atom)
+        return self.bits, self.t
+
+def _require(state, step, *atoms):
+    for atom in atoms:
+        if atom not in state:
+            raise ValueError(f"Plan step {step} is not applicable: {atom} does not hold.")
+
+def _require_free_hand(state, step):
+    if ("left-hand-empty",) not in state and ("right-hand-empty",) not in state:
+        raise ValueError(f"Plan step {step} is not applicable: both hands are busy.")
+
+_HANDS = {
+    "left": (("left-hand-empty",),),
+    "right": (("right-hand-empty",),),
+    "both": (("left-hand-empty",), ("right-hand-empty",)),
+}
+
+def simulate_plan(objects: Dict[str, str], init, actions) -> StateTrace:
+    """Simulate a plan of the manipulation domain and record the facts of every visited state."""
+    builder = _TraceBuilder(init)
+    state = builder.state
+    electrical_items = [o for o, t in objects.items() if t == "electrical-item"]
+
+    for step in actions:
+        name, args = step[0], step[1:]
+        if name == "go-to":
+            origin, destination = args
+            _require(state, step, ("robot-at", origin))
+            if ("connected", origin, destination) not in state and ("connected", destination, origin) not in state:
+                raise ValueError(f"Plan step {step} is not applicable: locations are not connected.")
+            held = [e for e in electrical_items
+                    if any((f"holding-{hand}", e) in state for hand in _HANDS)]
+            builder.t += 1
+            builder.delete(("robot-at", origin))
+            for e in held:
+                builder.delete(("plugged-in", e))
+            builder.add(("robot-at", destination))
+        elif name.startswith("pick-") and name[5:] in _HANDS:
+            obj, loc = args
+            hands = _HANDS[name[5:]]
+            _require(state, step, ("at", obj, loc), ("robot-at", loc), *hands)
+            builder.t += 1
+            builder.delete(("at", obj, loc))
+            for hand in hands:
+                builder.delete(hand)
+            builder.add((f"holding-{name[5:]}", obj))
+        elif name.startswith("place-") and name[6:] in _HANDS:
+            obj, loc = args
+            _require(state, step, (f"holding-{name[6:]}", obj), ("robot-at", loc))
+            builder.t += 1
+            builder.delete((f"holding-{name[6:]}", obj))
+            builder.add(("at", obj, loc))
+            for hand in _HANDS[name[6:]]:
+                builder.add(hand)
+        elif name in ("plug-in", "unplug"):
+            item, loc = args
+            _require(state, step, ("at", item, loc), ("robot-at", loc))
+            _require_free_hand(state, step)
+            if (("plugged-in", item) in state) != (name == "unplug"):
+                raise ValueError(f"Plan step {step} is not applicable: wrong plugged-in status.")
+            builder.t += 1
+            if name == "plug-in":
+                builder.add(("plugged-in", item))
+            else:
+                builder.delete(("plugged-in", item))
+        else:
+            raise ValueError(f"Unknown action in plan step {step}.")
+
+    bits, length = builder.finish()
+    return StateTrace(objects, bits, length)
+
+Check = Callable[[StateTrace, Dict[str, str]], int]
+
+def _is_parameter(token: str) -> bool:
+    return token.startswith("?") or token.startswith("{")
+
+def compile_formula(formula: SExpr) -> Check:
+    """Compile a PDDL formula into a function of a trace and parameter bindings.
+
+    The function returns a bitset of the timesteps in which the formula holds.
+    Parameters are quantified variables (`?l`) and template placeholders
+    (`{obj_name}`). Bare formulas are evaluated state by state; the modal
+    operators `always`, `sometime` and `at-end` hold in all or no timesteps.
+    """
+    if not isinstance(formula, list) or not formula:
+        raise NotImplementedError(f"Cannot compile formula {formula}.")
+    head, operands = formula[0], formula[1:]
+
+    if head == "and":
+        parts = [compile_formula(f) for f in operands]
+        def check(trace, env):
+            res = trace.mask
+            for part in parts:
+                res &= part(trace, env)
+                if not res:
+                    break
+            return res
+    elif head == "or":
+        parts = [compile_formula(f) for f in operands]
+        def check(trace, env):
+            res = 0
+            for part in parts:
+                res |= part(trace, env)
+            return res
+    elif head == "not":
+        (part,) = [compile_formula(f) for f in operands]
+        def check(trace, env):
+            return trace.mask & ~part(trace, env)
+    elif head == "imply":
+        antecedent, consequent = [compile_formula(f) for f in operands]
+        def check(trace, env):
+            return (trace.mask & ~antecedent(trace, env)) | consequent(trace, env)
+    elif head in ("forall", "exists"):
+        variables = list(parse_typed_list(operands[0]).items())
+        body = compile_formula(operands[1])
+        universal = head == "forall"
+        def check(trace, env):
+            res = trace.mask if universal else 0
+            domains = [trace.objects_of_type(t) for _, t in variables]
+            for values in product(*domains):
+                inner = dict(env)
+                inner.update(zip((v for v, _ in variables), values))
+                if universal:
+                    res &= body(trace, inner)
+                    if not res:
+                        break
+                else:
+                    res |= body(trace, inner)
+            return res
+    elif head in ("always", "sometime", "at-end"):
+        (body,) = [compile_formula(f) for f in operands]
+        def check(trace, env):
+            bits = body(trace, env)
+            if head == "always":
+                holds = bits == trace.mask
+            elif head == "sometime":
+                holds = bits != 0
+            else:
+                holds = bool(bits >> (trace.length - 1))
+            return trace.mask if holds else 0
+    elif head == "=":
+        left, right = operands
+        def check(trace, env):
+            return trace.mask if env.get(left, left) == env.get(right, right) else 0
+    elif all(isinstance(arg, str) for arg in operands):
+        if not any(_is_parameter(arg) for arg in operands):
+            atom = tuple(formula)
+            def check(trace, env):
+                return trace.fact(atom)
+        else:
+            def check(trace, env):
+                return trace.fact((head,) + tuple(env.get(arg, arg) for arg in operands))
+    else:
+        raise NotImplementedError(f"Cannot compile formula with operator '{head}'.")
+    return check
+
+def _unify(pattern: SExpr, expr: SExpr, env: Dict[str, str]) -> bool:
+    if isinstance(pattern, str):
+        if pattern.startswith("{"):
+            return isinstance(expr, str) and env.setdefault(pattern, expr) == expr
+        return pattern == expr
+    if not isinstance(expr, list) or len(pattern) != len(expr):
+        return False
+    return all(_unify(p, e, env) for p, e in zip(pattern, expr))
+
+class ConstraintCompiler:
+    """Compiles every template of `constraint-templates/` once into a trace check.
+
+    Constraints are mapped back to the template they were rendered from, so
+    that all instances of a template share its compiled check and only differ
+    in their bindings. The mapping is memoized per constraint text.
+    """
+
+    def __init__(self):
+        self._templates = []
+        self._checks_by_id: Dict[int, Check] = {}
+        for name, template in get_template_registry().category(CONSTRAINT_TEMPLATES).items():
+            pattern = parse_sexpr(template.pddl_source)
+            check = compile_formula(pattern)
+            self._templates.append((name, pattern, check))
+            self._checks_by_id[template.template_id] = check
+        self._cache: Dict[str, Tuple[Optional[str], Optional[Check], Dict[str, str]]] = {}
+
+    def _lookup(self, constraint_pddl: str) -> Tuple[Optional[str], Optional[Check], Dict[str, str]]:
+        try:
+            return self._cache[constraint_pddl]
+        except KeyError:
+            pass
+
+        res = self._match(parse_sexpr(constraint_pddl))
+        self._cache[constraint_pddl] = res
+        return res
+
+    def _match(self, expr: SExpr) -> Tuple[Optional[str], Optional[Check], Dict[str, str]]:
+        for name, pattern, check in self._templates:
+            env = {}
+            if _unify(pattern, expr, env):
+                return name, check, env
+        try:
+            return None, compile_formula(expr), {}
+        except NotImplementedError:
+            return None, None, {}
+
+    def compile(self, constraint_pddl: str) -> Optional[Tuple[Check, Dict[str, str]]]:
+        """Return the check of a constraint and its bindings, or None if it cannot be compiled."""
+        name, check, env = self._lookup(constraint_pddl)
+        return None if check is None else (check, env)
+
+    def compile_predicate(self, constraint: Predicate) -> Optional[Tuple[Check, Dict[str, str]]]:
+        """Return the check of a constraint instantiated from a template, and its bindings."""
+        check = self._checks_by_id.get(constraint.template_id)
+        if check is None:
+            return self.compile(constraint.pddl)
+        return check, {"{" + k + "}": v for k, v in constraint.params.items()}
+
+    def compile_expr(self, expr: SExpr) -> Optional[Tuple[Check, Dict[str, str]]]:
+        """Like `compile`, for a constraint that was already parsed."""
+        name, check, env = self._match(expr)
+        return None if check is None else (check, env)
+
+    def identify(self, constraint_pddl: str) -> Tuple[Optional[str], Dict[str, str]]:
+        """Return the template a constraint was rendered from (None if unknown) and its placeholders."""
+        name, check, env = self._lookup(constraint_pddl)
+        return name, {k[1:-1]: v for k, v in env.items()}
+
+@lru_cache(maxsize=None)
+def get_constraint_compiler() -> ConstraintCompiler:
+    return ConstraintCompiler()
+
+class TraceEvaluator:
+    """Evaluates constraints against a plan by simulating it only once."""
+
+    def __init__(self, pddl_problem: str, plan: str):
+        problem = parse_problem(pddl_problem)
+        self.trace = simulate_plan(problem.objects, problem.init, parse_plan(plan))
+
+    def violated_constraints(self, constraints: Sequence[Predicate]) -> List[Optional[bool]]:
+        """Tell for each constraint whether some state along the plan violates it.
+
+        Constraints are evaluated with the PDDL3 semantics of bare formulas,
+        i.e. they must hold in every state. The result is None for constraints
+        that could not be compiled.
+        """
+        return [self.is_violated(constraint) for constraint in constraints]
+
+    def is_violated(self, constraint: Predicate) -> Optional[bool]:
+        compiled = get_constraint_compiler().compile_predicate(constraint)
+        if compiled is None:
+            return None
+        check, env = compiled
+        return check(self.trace, env) != self.trace.mask
@@ -1,2 +1,24 @@
+import hashlib
+import os
+import tempfile
+from typing import Union
+
 def postprocess(x):
-    return x.strip()
\ No newline at end of file
+    return x.strip()
+
+def derive_seed(master_seed: int, *path) -> int:
+    """Derive a reproducible 64-bit seed from a master seed and a path (e.g. a problem index)."""
+    key = ":".join(str(e) for e in (master_seed,) + path)
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], "big")
+
+def write_atomic(file_path: str, content: Union[str, bytes]):
+    """Write a file so that readers either see its previous version or the complete new one."""
+    directory = os.path.dirname(file_path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(file_path))
+    try:
+        with os.fdopen(fd, "wb" if isinstance(content, bytes) else "w") as file:
+            file.write(content)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise